@@ -1,15 +1,144 @@
 """
 Celery configuration with GPU/CPU task routing
+
+Queue placement is declared in task_routes; each worker consumes only the
+queue it can serve. Start them as prefork pools that reserve one task per
+process, without broker chatter, e.g.:
+    CUDA_VISIBLE_DEVICES=0 WORKER_PRELOAD_DEVICE=cuda celery -A app.celery_app worker -Q gpu_tasks -P prefork --concurrency=1 --prefetch-multiplier=1 -Ofair --without-gossip --without-mingle --without-heartbeat
+    celery -A app.celery_app worker -Q cpu_tasks -P prefork --concurrency=$(nproc) --prefetch-multiplier=1 -Ofair --without-gossip --without-mingle --without-heartbeat
+    celery -A app.celery_app worker -Q cpu_large_tasks -P prefork --concurrency=1 --prefetch-multiplier=1 -Ofair --without-gossip --without-mingle --without-heartbeat
 """
 from celery import Celery
+from celery.signals import worker_process_init
+from kombu.serialization import register
+from functools import lru_cache
+from typing import List, Optional, Tuple
+from .config import settings
+import json
+import msgpack
 import redis
+import redis.asyncio as aioredis
 import torch
 import logging
 
 logger = logging.getLogger("projectcars")
 
-# Redis connection
-redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
+
+@lru_cache(maxsize=1)
+def _get_redis():
+    """Per-process Redis client backed by an explicit connection pool"""
+    return redis.Redis(
+        connection_pool=redis.ConnectionPool(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB,
+            max_connections=32,
+            socket_keepalive=True,
+            decode_responses=True,
+        )
+    )
+
+@lru_cache(maxsize=1)
+def get_async_redis():
+    """Per-process asyncio Redis client for the API (pub/sub waits)"""
+    return aioredis.Redis(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB,
+        socket_keepalive=True,
+        decode_responses=True,
+    )
+
+
+def task_done_channel(video_id: int) -> str:
+    """Pub/sub channel announcing that processing of a video has finished"""
+    return f"task-done:{video_id}"
+
+
+def progress_key(video_id: int) -> str:
+    """Redis key (and pub/sub channel) carrying a video's latest progress"""
+    return f"video:{video_id}:progress"
+
+
+# Progress snapshots outlive a crashed worker by at most this long. Every
+# publish (~2 Hz while frames flow) refreshes it, so once the key expires
+# status reads fall through to the DB / Celery state (e.g. FAILURE)
+PROGRESS_TTL = 30
+
+
+def publish_progress(video_id: int, meta: dict):
+    """Store the latest progress snapshot and announce it, in one round-trip"""
+    payload = json.dumps(meta)
+    try:
+        pipe = _get_redis().pipeline(transaction=False)
+        pipe.set(progress_key(video_id), payload, ex=PROGRESS_TTL)
+        pipe.publish(progress_key(video_id), payload)
+        pipe.execute()
+    except Exception as e:
+        # Progress is best-effort; never fail the task over this
+        logger.warning(f"Failed to publish progress for video {video_id}: {e}")
+
+
+def get_progress_many(video_ids: List[int]) -> List[Optional[dict]]:
+    """Latest progress snapshots for several videos with a single MGET"""
+    if not video_ids:
+        return []
+    try:
+        raw = _get_redis().mget([progress_key(video_id) for video_id in video_ids])
+    except Exception as e:
+        logger.warning(f"Failed to read progress: {e}")
+        return [None] * len(video_ids)
+    return [json.loads(value) if value is not None else None for value in raw]
+
+
+def get_progress(video_id: int) -> Optional[dict]:
+    """Latest progress snapshot for a video, or None"""
+    return get_progress_many([video_id])[0]
+
+
+def clear_progress(video_id: int):
+    """Drop a video's progress snapshot (e.g. when the video is deleted)"""
+    try:
+        _get_redis().delete(progress_key(video_id))
+    except Exception as e:
+        # The snapshot lapses after PROGRESS_TTL anyway
+        logger.warning(f"Failed to clear progress for video {video_id}: {e}")
+
+
+def publish_task_done(video_id: int, status: str):
+    """Notify waiting API clients that a video reached a terminal status"""
+    try:
+        pipe = _get_redis().pipeline(transaction=False)
+        pipe.delete(progress_key(video_id))
+        pipe.publish(task_done_channel(video_id), status)
+        pipe.execute()
+    except Exception as e:
+        # Waiters fall back to their timeout; never fail the task over this
+        logger.warning(f"Failed to publish completion for video {video_id}: {e}")
+
+
+# CUDA availability does not change at runtime, so probe the driver once per
+# process. Both are lazy: querying the device name creates a CUDA context,
+# which must not happen in the parent before prefork workers are forked.
+@lru_cache(maxsize=1)
+def cuda_available() -> bool:
+    """Cached torch.cuda.is_available()"""
+    return torch.cuda.is_available()
+
+
+@lru_cache(maxsize=1)
+def cuda_device_name():
+    """Cached name of CUDA device 0, or None without CUDA"""
+    return torch.cuda.get_device_name(0) if cuda_available() else None
+
+# msgpack codec that accepts non-string map keys (stats are keyed by track id)
+register(
+    'msgpack',
+    lambda obj: msgpack.packb(obj, use_bin_type=True),
+    lambda data: msgpack.unpackb(data, raw=False, strict_map_key=False),
+    content_type='application/x-msgpack',
+    content_encoding='binary',
+)
 
 # Create Celery app
 celery_app = Celery(
@@ -21,9 +150,10 @@ celery_app = Celery(
 
 # Celery configuration
 celery_app.conf.update(
-    task_serializer='json',
-    accept_content=['json'],
-    result_serializer='json',
+    task_serializer='msgpack',
+    accept_content=['msgpack', 'json'],  # json kept for tasks queued before the switch
+    result_serializer='msgpack',
+    result_accept_content=['msgpack', 'json'],
     timezone='UTC',
     enable_utc=True,
     task_track_started=True,
@@ -31,25 +161,73 @@ celery_app.conf.update(
     worker_prefetch_multiplier=1,
     task_time_limit=30 * 60,  # 30 minutes max
     task_soft_time_limit=25 * 60,  # 25 minutes warning
+    task_acks_on_failure_or_timeout=True,
+    worker_disable_rate_limits=True,
+    broker_connection_retry_on_startup=True,
+    result_expires=3600,  # 1 hour
 )
 
-# Define task routes
-celery_app.conf.task_routes = {
-    'app.tasks.process_video_gpu': {'queue': 'gpu_tasks'},
-    'app.tasks.process_video_cpu': {'queue': 'cpu_tasks'},
+# GPU lock expires just after the hard time limit of the video tasks
+# (app.tasks.VIDEO_TASK_TIME_LIMIT, 60 min)
+GPU_LOCK_TTL = 65 * 60
+
+# Unacked tasks must not be redelivered while still running
+celery_app.conf.broker_transport_options = {
+    'visibility_timeout': GPU_LOCK_TTL,
+    'socket_keepalive': True,
 }
 
+@worker_process_init.connect
+def _reset_worker_process_state(**kwargs):
+    """Give each forked worker its own Redis pool and CUDA probe"""
+    _get_redis.cache_clear()
+    cuda_available.cache_clear()
+    cuda_device_name.cache_clear()
+    
+    # Opt-in per worker (e.g. WORKER_PRELOAD_DEVICE=cuda for the GPU worker):
+    # the first video then skips weight loading and CUDA warmup
+    if settings.WORKER_PRELOAD_DEVICE:
+        from .video_processor import VideoProcessor
+        try:
+            VideoProcessor(device=settings.WORKER_PRELOAD_DEVICE).warmup()
+        except Exception as e:
+            logger.warning(f"Model preload on {settings.WORKER_PRELOAD_DEVICE} failed: {e}")
+
+
+# Long CPU jobs get their own queue so short videos aren't stuck behind them
+LARGE_VIDEO_QUEUE = 'cpu_large_tasks'
+
+
+def route_large_videos(name, args, kwargs, options, task=None, **kw):
+    """Dynamic router: CPU videos with many frames go to LARGE_VIDEO_QUEUE"""
+    if name != 'app.tasks.process_video_cpu':
+        return None
+    total_frames = (options.get('headers') or {}).get('total_frames') or 0
+    if total_frames >= settings.LARGE_VIDEO_FRAMES:
+        return {'queue': LARGE_VIDEO_QUEUE}
+    return None
+
+
+# Define task routes (routers are consulted in order)
+celery_app.conf.task_routes = (
+    route_large_videos,
+    {
+        'app.tasks.process_video_gpu': {'queue': 'gpu_tasks'},
+        'app.tasks.process_video_cpu': {'queue': 'cpu_tasks'},
+    },
+)
+
 
 def is_gpu_available():
     """Check if GPU is available and not busy"""
     try:
         # Check CUDA availability
-        if not torch.cuda.is_available():
+        if not cuda_available():
             logger.warning("CUDA not available")
             return False
         
         # Check if GPU is busy
-        gpu_busy = redis_client.get('gpu_busy')
+        gpu_busy = _get_redis().get('gpu_busy')
         if gpu_busy and int(gpu_busy) == 1:
             logger.info("GPU is currently busy")
             return False
@@ -62,47 +240,104 @@ def is_gpu_available():
         return False
 
 
+def try_acquire_gpu() -> bool:
+    """
+    Atomically claim the GPU with SET NX EX
+    Only one dispatcher can win; the TTL frees the GPU if a worker dies
+    """
+    try:
+        acquired = bool(_get_redis().set('gpu_busy', 1, nx=True, ex=GPU_LOCK_TTL))
+    except Exception as e:
+        logger.error(f"GPU lock acquisition failed: {e}")
+        return False
+    
+    if acquired:
+        logger.info("GPU marked as: BUSY")
+    return acquired
+
+
 def mark_gpu_busy(busy: bool):
     """Mark GPU as busy or free in Redis"""
-    redis_client.set('gpu_busy', 1 if busy else 0)
+    if busy:
+        _get_redis().set('gpu_busy', 1, ex=GPU_LOCK_TTL)
+    else:
+        _get_redis().delete('gpu_busy')
     status = "BUSY" if busy else "FREE"
     logger.info(f"GPU marked as: {status}")
 
 
-def route_task_to_worker(video_id: int, config: dict):
+def release_gpu_for_next():
+    """Free the GPU as soon as inference ends so the router can send the next video to it"""
+    mark_gpu_busy(False)
+
+
+def route_task_to_worker(video_id: int, config: dict, producer=None, total_frames: Optional[int] = None):
     """
     Smart task routing: GPU if available, else CPU
+    The queue itself comes from task_routes; total_frames lets the router
+    send long CPU jobs to the large queue
+    Pass a shared kombu producer to reuse one broker connection
     Returns the Celery task result
     """
     from app.tasks import process_video_gpu, process_video_cpu
     
-    if is_gpu_available():
+    # Check-and-claim in one atomic Redis command (no GET/SET race)
+    gpu_ok = cuda_available() and try_acquire_gpu()
+    logger.info(f"[ROUTER] Dispatching to {'GPU' if gpu_ok else 'CPU'} worker with config: {config}")
+    headers = {'total_frames': total_frames or 0}
+    
+    if gpu_ok:
         logger.info(f"🚀 Routing video {video_id} to GPU worker")
-        mark_gpu_busy(True)
-        logger.info(f"[ROUTER] Dispatching to {'gpu_tasks' if is_gpu_available() else 'cpu_tasks'} with config: {config}")
-        return process_video_gpu.apply_async(
-            args=[video_id, config],
-            queue='gpu_tasks'
-        )
+        try:
+            return process_video_gpu.apply_async(
+                args=[video_id, config],
+                headers=headers,
+                producer=producer
+            )
+        except Exception:
+            # Task never reached the broker - don't leave the GPU claimed
+            mark_gpu_busy(False)
+            raise
     else:
         logger.info(f"⚙️ GPU busy, routing video {video_id} to CPU worker")
         return process_video_cpu.apply_async(
             args=[video_id, config],
-            queue='cpu_tasks'
+            headers=headers,
+            producer=producer
         )
 
 
+def route_tasks_to_workers(items: List[Tuple[int, dict, Optional[int]]]):
+    """
+    Batch variant of route_task_to_worker for bulk enqueues
+    Items are (video_id, config, total_frames); total_frames feeds the large
+    video router exactly as for single enqueues
+    All publishes share a single producer (one broker connection/channel)
+    Returns the Celery task results in input order
+    """
+    with celery_app.producer_or_acquire() as producer:
+        return [
+            route_task_to_worker(
+                video_id, config, producer=producer, total_frames=total_frames
+            )
+            for video_id, config, total_frames in items
+        ]
+
+
 def get_system_status():
     """Get current system status"""
     try:
-        gpu_available = torch.cuda.is_available()
-        gpu_busy = redis_client.get('gpu_busy')
+        # PING and GET in a single round-trip
+        pipe = _get_redis().pipeline()
+        pipe.ping()
+        pipe.get('gpu_busy')
+        ping_ok, gpu_busy = pipe.execute()
         
         status = {
-            "redis_connected": redis_client.ping(),
-            "gpu_available": gpu_available,
+            "redis_connected": ping_ok,
+            "gpu_available": cuda_available(),
             "gpu_busy": bool(gpu_busy and int(gpu_busy) == 1),
-            "gpu_name": torch.cuda.get_device_name(0) if gpu_available else None,
+            "gpu_name": cuda_device_name(),
         }
         
         return status
@@ -10,6 +10,8 @@ class Settings(BaseSettings):
     
     # Database
     DATABASE_URL: str = "sqlite:///./database.db"
+    DB_POOL_SIZE: int = 32
+    DB_MAX_OVERFLOW: int = 32
     
     # File storage
     UPLOAD_DIR: str = "uploads"
@@ -17,12 +19,24 @@ class Settings(BaseSettings):
     
     # File limits
     MAX_FILE_SIZE: int = 500 * 1024 * 1024  # 500MB
-    ALLOWED_EXTENSIONS: list = [".mp4", ".avi", ".mov", ".mkv", ".wmv"]
+    ALLOWED_EXTENSIONS: frozenset[str] = frozenset({".mp4", ".avi", ".mov", ".mkv", ".wmv"})
     
     # YOLO settings
     YOLO_MODEL: str = "/app/yolo11x.pt"
     CONFIDENCE_THRESHOLD: float = 0.3
     IOU_THRESHOLD: float = 0.7
+    INFERENCE_BATCH_SIZE: int = 8  # frames per forward pass
+    USE_TRT: bool = False  # FP16 TensorRT engine on CUDA workers
+    WORKER_PRELOAD_DEVICE: str = ""  # "cuda"/"cpu": load + warm the model at worker start
+    
+    # CPU videos at or above this many frames go to the large queue
+    LARGE_VIDEO_FRAMES: int = 18000  # 10 min at 30 fps
+    
+    # Worker threads for sync endpoints (anyio's default is 40)
+    API_THREADPOOL_SIZE: int = 64
+    
+    # Logging (DEBUG for development)
+    LOG_LEVEL: str = "INFO"
     
     # CORS
     CORS_ORIGINS: list = ["http://localhost:5173", "http://localhost:3000","https://nonvisional-silky-randi.ngrok-free.dev"]
@@ -1,26 +1,50 @@
 """
 FastAPI main application with comprehensive logging
 """
-from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse
+from sqlalchemy import and_, case, func, select, update
 from sqlalchemy.orm import Session
 from pathlib import Path
 from datetime import datetime
-
-import shutil
+from fractions import Fraction
+from typing import Optional
+
+import os
+import stat
+import asyncio
+import anyio
+import json
+import subprocess
+import time
 import uuid
-import torch
+import atexit
 import logging
+import queue
 import sys
+from logging.handlers import QueueHandler, QueueListener
 from celery.result import AsyncResult
 from celery.app.control import Inspect
-from .celery_app import celery_app, route_task_to_worker, get_system_status
+from .celery_app import (
+    celery_app,
+    route_task_to_worker,
+    get_system_status,
+    get_async_redis,
+    task_done_channel,
+    get_progress,
+    get_progress_many,
+    clear_progress,
+    publish_task_done,
+    cuda_available,
+    cuda_device_name,
+)
 
 
 from .config import settings
-from .database import get_db, init_db
-from .models import Video, VehicleDetection
+from .database import SessionLocal, get_db, init_db
+from .models import Video, VehicleDetection, VIDEO_API_COLUMNS, calculate_progress, video_to_dict
 from .schemas import (
     VideoResponse,
     VideoStatusResponse,
@@ -37,13 +61,14 @@ import io
 # LOGGING SETUP
 # ============================================================================
 
-# Create logger
+# Create logger (level driven by LOG_LEVEL env var)
+log_level = getattr(logging, settings.LOG_LEVEL.upper(), logging.INFO)
 logger = logging.getLogger("projectcars")
-logger.setLevel(logging.DEBUG)
+logger.setLevel(log_level)
 
 # Create console handler with formatting
 console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setLevel(logging.DEBUG)
+console_handler.setLevel(log_level)
 
 # Create file handler for persistent logs
 file_handler = logging.FileHandler("projectcars.log")
@@ -63,9 +88,16 @@ simple_formatter = logging.Formatter(
 console_handler.setFormatter(simple_formatter)
 file_handler.setFormatter(detailed_formatter)
 
+# Console/file writes happen on a background listener thread; request
+# threads only push records onto the queue
+log_queue = queue.Queue(-1)
+queue_handler = QueueHandler(log_queue)
+log_listener = QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
 # Add handlers to logger
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
+logger.addHandler(queue_handler)
 
 # Log startup
 logger.info("=" * 80)
@@ -80,7 +112,8 @@ logger.info("=" * 80)
 app = FastAPI(
     title="ProjectCars API",
     description="Vehicle Speed Detection API",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 logger.info("FastAPI app initialized")
@@ -88,23 +121,15 @@ logger.info("FastAPI app initialized")
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Allow all origins for development
+    allow_origins=settings.CORS_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 logger.info("CORS middleware configured")
 
-# Add CORS headers for preflight requests
-@app.middleware("http")
-async def add_cors_headers(request, call_next):
-    response = await call_next(request)
-    response.headers["Access-Control-Allow-Origin"] = "*"
-    response.headers["Access-Control-Allow-Methods"] = "*"
-    response.headers["Access-Control-Allow-Headers"] = "*"
-    return response
-
 # Initialize database on startup
 @app.on_event("startup")
 def startup_event():
@@ -115,10 +140,9 @@ def startup_event():
         logger.info("Database initialized successfully")
         
         # Check CUDA availability
-        cuda_available = torch.cuda.is_available()
-        if cuda_available:
-            cuda_device = torch.cuda.get_device_name(0)
-            logger.info(f"CUDA is available - Using GPU: {cuda_device}")
+        if cuda_available():
+            cuda_device = cuda_device_name()
+            logger.info("CUDA is available - Using GPU: %s", cuda_device)
         else:
             logger.warning("CUDA not available - Using CPU (processing will be slower)")
         
@@ -127,30 +151,39 @@ def startup_event():
         processed_dir = Path(settings.PROCESSED_DIR)
         
         if not upload_dir.exists():
-            logger.warning(f"Upload directory not found, creating: {upload_dir}")
+            logger.warning("Upload directory not found, creating: %s", upload_dir)
             upload_dir.mkdir(parents=True, exist_ok=True)
         else:
-            logger.info(f"Upload directory exists: {upload_dir}")
+            logger.info("Upload directory exists: %s", upload_dir)
             
         if not processed_dir.exists():
-            logger.warning(f"Processed directory not found, creating: {processed_dir}")
+            logger.warning("Processed directory not found, creating: %s", processed_dir)
             processed_dir.mkdir(parents=True, exist_ok=True)
         else:
-            logger.info(f"Processed directory exists: {processed_dir}")
+            logger.info("Processed directory exists: %s", processed_dir)
         
         logger.info("Startup complete - API is ready")
-        logger.info("Available routes:")
-        for route in app.routes:
-            route_type = type(route).__name__
-            methods = getattr(route, "methods", "—")
-            logger.info(f"  [{route_type}] {methods} {route.path}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Available routes:")
+            for route in app.routes:
+                route_type = type(route).__name__
+                methods = getattr(route, "methods", "—")
+                logger.info("  [%s] %s %s", route_type, methods, route.path)
 
         
     except Exception as e:
-        logger.error(f"Startup failed: {str(e)}", exc_info=True)
+        logger.error("Startup failed: %s", e, exc_info=True)
         raise
 
 
+@app.on_event("startup")
+async def configure_threadpool():
+    """Size the threadpool that runs sync endpoints and run_in_threadpool work"""
+    # Must run on the event loop: the limiter is stored per loop
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.API_THREADPOOL_SIZE
+    logger.info("Threadpool size: %s", settings.API_THREADPOOL_SIZE)
+
+
 @app.on_event("shutdown")
 def shutdown_event():
     """Cleanup on shutdown"""
@@ -161,52 +194,325 @@ def shutdown_event():
 # HELPER FUNCTIONS
 # ============================================================================
 
-def save_upload_file(upload_file: UploadFile) -> str:
+# Heavy modules are imported on first use (not at API startup) and cached
+_cv2 = None
+_av = None
+_video_processor_cls = None
+
+
+def get_cv2():
+    """Return the cv2 module, importing it once"""
+    global _cv2
+    if _cv2 is None:
+        import cv2
+        _cv2 = cv2
+    return _cv2
+
+
+def get_av():
+    """Return the PyAV module (imported once), or None if it isn't installed"""
+    global _av
+    if _av is None:
+        try:
+            import av
+        except ImportError:
+            av = False
+        _av = av
+    return _av or None
+
+
+def get_video_processor_cls():
+    """Return the VideoProcessor class, importing it once"""
+    global _video_processor_cls
+    if _video_processor_cls is None:
+        from .video_processor import VideoProcessor
+        _video_processor_cls = VideoProcessor
+    return _video_processor_cls
+
+
+# ffprobe only demuxes headers; anything slower means a broken file
+FFPROBE_TIMEOUT = 10
+
+# Written by video_processor.save_snapshot
+SNAPSHOT_DIR = Path("processed/snapshots")
+
+
+class LargeFileResponse(FileResponse):
+    """FileResponse streaming in 1 MiB chunks (Starlette default is 64 KiB)"""
+    chunk_size = 1024 * 1024
+
+
+# First-frame JPEGs cached at upload for the calibration page
+THUMBNAIL_DIR = Path(settings.PROCESSED_DIR) / "thumbs"
+THUMBNAIL_JPEG_QUALITY = 85
+
+
+def thumbnail_path(video_id: int) -> Path:
+    """Path of the cached first-frame JPEG for a video"""
+    return THUMBNAIL_DIR / f"{video_id}.jpg"
+
+
+def cache_thumbnail(video_path: str, video_id: int) -> bool:
+    """Decode the first frame once and cache it as a JPEG; returns success"""
+    cv2 = get_cv2()
+    
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            logger.error("Failed to open video file for frame extraction: %s", video_path)
+            return False
+        success, frame = cap.read()
+    finally:
+        cap.release()
+    
+    if not success or frame is None:
+        logger.error("Failed to read frame from video: %s", video_path)
+        return False
+    
+    success, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_JPEG_QUALITY])
+    if not success:
+        logger.error("Failed to encode video frame as JPEG")
+        return False
+    
+    # Write-then-rename so concurrent readers never see a partial file
+    dest = thumbnail_path(video_id)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_suffix(".tmp")
+    tmp.write_bytes(buffer.tobytes())
+    os.replace(tmp, dest)
+    return True
+
+
+# Upper bound for the /wait long-poll, in seconds
+MAX_WAIT_TIMEOUT = 300.0
+
+# Chunk size for copying uploads to disk (shutil.copyfileobj uses 64 KiB)
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def _file_too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File too large. Maximum size: {settings.MAX_FILE_SIZE // (1024 * 1024)} MB"
+    )
+
+
+def _copy_upload(src, dst, max_bytes: int) -> None:
+    """Copy an upload spool into dst, in-kernel via sendfile when possible
+
+    Raises 413 as soon as more than max_bytes would be written.
+    """
+    # Only use fileno() once the spool is on disk - calling it on an
+    # in-memory SpooledTemporaryFile would force a rollover
+    if getattr(src, "_rolled", False) and hasattr(os, "sendfile"):
+        src.flush()
+        src_fd, dst_fd = src.fileno(), dst.fileno()
+        offset = src.tell()
+        remaining = os.fstat(src_fd).st_size - offset
+        if remaining > max_bytes:
+            raise _file_too_large()
+        # Reserve the whole extent up front so the filesystem allocates it once
+        if remaining and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(dst_fd, 0, remaining)
+            except OSError:
+                pass  # not supported by every filesystem
+        # Ask for everything left; the kernel returns short counts as needed
+        while remaining > 0:
+            sent = os.sendfile(dst_fd, src_fd, offset, remaining)
+            if sent == 0:
+                break
+            offset += sent
+            remaining -= sent
+    else:
+        written = 0
+        while chunk := src.read(UPLOAD_CHUNK_SIZE):
+            written += len(chunk)
+            if written > max_bytes:
+                raise _file_too_large()
+            dst.write(chunk)
+
+
+def file_extension(filename: str) -> str:
+    """Lowercased extension with leading dot, like Path.suffix without the PurePath"""
+    stem, dot, ext = (filename or "").rpartition(".")
+    return f".{ext.lower()}" if dot and stem else ""
+
+
+async def save_upload_file(upload_file: UploadFile) -> str:
     """Save uploaded file and return path"""
-    logger.debug(f"Saving uploaded file: {upload_file.filename}")
+    logger.debug("Saving uploaded file: %s", upload_file.filename)
+    
+    # Reject before touching the disk
+    file_ext = file_extension(upload_file.filename)
+    if file_ext not in settings.ALLOWED_EXTENSIONS:
+        logger.warning("Invalid file extension: %s", file_ext)
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid file type. Allowed: {sorted(settings.ALLOWED_EXTENSIONS)}"
+        )
     
     try:
         # Generate unique filename
-        file_ext = Path(upload_file.filename).suffix
         unique_filename = f"{uuid.uuid4()}{file_ext}"
         file_path = Path(settings.UPLOAD_DIR) / unique_filename
         
-        logger.debug(f"Generated unique filename: {unique_filename}")
+        logger.debug("Generated unique filename: %s", unique_filename)
         
-        # Save file
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(upload_file.file, buffer)
+        # Save file off the event loop, dropping partial writes on failure
+        try:
+            with file_path.open("wb") as buffer:
+                await run_in_threadpool(_copy_upload, upload_file.file, buffer, settings.MAX_FILE_SIZE)
+        except BaseException:
+            file_path.unlink(missing_ok=True)
+            raise
         
         file_size = file_path.stat().st_size
-        logger.info(f"File saved successfully: {file_path} (size: {file_size / 1024 / 1024:.2f} MB)")
+        logger.info("File saved successfully: %s (size: %.2f MB)", file_path, file_size / 1024 / 1024)
         
         return str(file_path)
         
+    except HTTPException:
+        # Expected client errors (e.g. 413 from _copy_upload), not save failures
+        raise
     except Exception as e:
-        logger.error(f"Failed to save file {upload_file.filename}: {str(e)}", exc_info=True)
+        logger.error("Failed to save file %s: %s", upload_file.filename, e, exc_info=True)
         raise
 
 
+def _probe_video_av(file_path: str):
+    """Read video metadata in-process with PyAV (header parse, no decode)
+
+    Returns None if PyAV is unavailable or the file has no usable video stream.
+    """
+    av = get_av()
+    if av is None:
+        return None
+    
+    try:
+        with av.open(file_path) as container:
+            if not container.streams.video:
+                return None
+            stream = container.streams.video[0]
+            rate = stream.average_rate or stream.base_rate
+            fps = float(rate) if rate else 0.0
+            
+            # Stream duration is missing for some containers (MKV) - use container duration
+            if stream.duration is not None and stream.time_base:
+                duration = float(stream.duration * stream.time_base)
+            elif container.duration is not None:
+                duration = container.duration / av.time_base
+            else:
+                duration = 0.0
+            
+            # frames is 0 when the container doesn't record it
+            total_frames = stream.frames or int(duration * fps)
+            width = stream.codec_context.width
+            height = stream.codec_context.height
+    except Exception as e:
+        logger.debug("PyAV metadata read failed for %s: %s", file_path, e)
+        return None
+    
+    if fps <= 0 or not width:
+        return None
+    
+    return {
+        "fps": int(fps),
+        "total_frames": total_frames,
+        "duration": duration or (total_frames / fps),
+        "width": width,
+        "height": height,
+    }
+
+
+def _probe_video_ffprobe(file_path: str):
+    """Read video metadata with ffprobe (container demux only, no decoder init)
+
+    Returns None if ffprobe is missing or the file has no usable video stream.
+    """
+    try:
+        result = subprocess.run(
+            [
+                "ffprobe", "-v", "error",
+                "-select_streams", "v:0",
+                "-show_entries", "stream=r_frame_rate,nb_frames,width,height,duration:format=duration",
+                "-of", "json",
+                file_path,
+            ],
+            capture_output=True,
+            text=True,
+            timeout=FFPROBE_TIMEOUT,
+            check=True,
+        )
+        probe = json.loads(result.stdout)
+        stream = (probe.get("streams") or [{}])[0]
+        fps = float(Fraction(stream.get("r_frame_rate", "0/1")))
+    except (OSError, subprocess.SubprocessError, ValueError, ZeroDivisionError) as e:
+        logger.debug("ffprobe metadata read failed for %s: %s", file_path, e)
+        return None
+    
+    if fps <= 0 or not stream.get("width"):
+        return None
+    
+    # Stream duration is missing for some containers (MKV) - use format duration
+    duration = stream.get("duration") or probe.get("format", {}).get("duration")
+    duration = float(duration) if duration else 0.0
+    
+    # nb_frames is exact for MP4/MOV; estimate from duration otherwise
+    nb_frames = stream.get("nb_frames")
+    total_frames = int(nb_frames) if nb_frames and nb_frames.isdigit() else int(duration * fps)
+    
+    return {
+        "fps": int(fps),
+        "total_frames": total_frames,
+        "duration": duration or (total_frames / fps),
+        "width": int(stream["width"]),
+        "height": int(stream["height"]),
+    }
+
+
+def _probe_video_cv2(file_path: str) -> dict:
+    """Read video metadata by opening the file with OpenCV"""
+    cv2 = get_cv2()
+    
+    cap = cv2.VideoCapture(file_path)
+    
+    if not cap.isOpened():
+        logger.error("Failed to open video file: %s", file_path)
+        raise ValueError("Cannot open video file")
+    
+    fps = int(cap.get(cv2.CAP_PROP_FPS))
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    
+    cap.release()
+    
+    return {
+        "fps": fps,
+        "total_frames": total_frames,
+        "duration": total_frames / fps if fps > 0 else 0,
+        "width": width,
+        "height": height,
+    }
+
+
 def get_video_info(file_path: str) -> dict:
-    """Extract video metadata"""
-    logger.debug(f"Extracting video info from: {file_path}")
+    """Extract video metadata (PyAV, then ffprobe, falling back to OpenCV)"""
+    logger.debug("Extracting video info from: %s", file_path)
     
     try:
-        import cv2
-        
-        cap = cv2.VideoCapture(file_path)
-        
-        if not cap.isOpened():
-            logger.error(f"Failed to open video file: {file_path}")
-            raise ValueError("Cannot open video file")
-        
-        fps = int(cap.get(cv2.CAP_PROP_FPS))
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        duration = total_frames / fps if fps > 0 else 0
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        
-        cap.release()
+        meta = _probe_video_av(file_path)
+        if meta is None:
+            meta = _probe_video_ffprobe(file_path)
+        if meta is None:
+            meta = _probe_video_cv2(file_path)
+        
+        fps = meta["fps"]
+        total_frames = meta["total_frames"]
+        duration = meta["duration"]
+        width = meta["width"]
+        height = meta["height"]
         
         info = {
             "fps": fps,
@@ -214,12 +520,12 @@ def get_video_info(file_path: str) -> dict:
             "duration": duration
         }
         
-        logger.info(f"Video info extracted: {width}x{height}, {fps} FPS, {total_frames} frames, {duration:.2f}s")
+        logger.info("Video info extracted: %sx%s, %s FPS, %s frames, %.2fs", width, height, fps, total_frames, duration)
         
         return info
         
     except Exception as e:
-        logger.error(f"Failed to extract video info from {file_path}: {str(e)}", exc_info=True)
+        logger.error("Failed to extract video info from %s: %s", file_path, e, exc_info=True)
         raise
 
 
@@ -231,28 +537,27 @@ def process_video_task(video_id: int, config: ProcessingRequest):
     db = SessionLocal()
     
     try:
-        logger.info(f"Starting background processing task for video ID: {video_id}")
+        logger.info("Starting background processing task for video ID: %s", video_id)
         
-        video = db.query(Video).filter(Video.id == video_id).first()
+        video = db.get(Video, video_id)
         
         if not video:
-            logger.error(f"Video not found in database: ID {video_id}")
+            logger.error("Video not found in database: ID %s", video_id)
             return
             
         # Update status
         video.status = "processing"
         db.commit()
-        logger.info(f"Video status updated to 'processing' for ID: {video_id}")
+        logger.info("Video status updated to 'processing' for ID: %s", video_id)
         
         # Prepare output path
         output_filename = f"processed_{Path(video.filename).stem}.mp4"
         output_path = Path(settings.PROCESSED_DIR) / output_filename
         
-        logger.debug(f"Output path: {output_path}")
+        logger.debug("Output path: %s", output_path)
         
         # Lazy import to avoid heavy deps at startup
-        logger.debug("Importing VideoProcessor...")
-        from .video_processor import VideoProcessor
+        VideoProcessor = get_video_processor_cls()
         
         logger.debug("Initializing VideoProcessor...")
         processor = VideoProcessor(
@@ -262,10 +567,23 @@ def process_video_task(video_id: int, config: ProcessingRequest):
         
         logger.info("VideoProcessor initialized, starting processing...")
         
-        # Progress callback
+        # Progress callback - commit at most once per second or per 1% progress
+        last_commit_ts = time.monotonic()
+        last_commit_frame = 0
+        
         def update_progress(current: int, total: int):
-            video.processed_frames = current
+            nonlocal last_commit_ts, last_commit_frame
+            now = time.monotonic()
+            if (now - last_commit_ts < 1.0
+                    and current - last_commit_frame < max(1, (total or 0) // 100)):
+                return
+            # Core UPDATE skips the ORM unit-of-work flush/dirty checking
+            db.execute(
+                update(Video).where(Video.id == video_id).values(processed_frames=current)
+            )
             db.commit()
+            last_commit_ts = now
+            last_commit_frame = current
         
         # Process video with calibration data
         stats = processor.process_video(
@@ -277,7 +595,8 @@ def process_video_task(video_id: int, config: ProcessingRequest):
             speed_limit=config.speed_limit if hasattr(config, 'speed_limit') else 80.0,
             video_id=video_id,  # ✅ ADD THIS LINE
             db=db,  # ✅ ADD THIS LINE
-            enable_plate_detection=config.enable_plate_detection if hasattr(config, 'enable_plate_detection') else False
+            enable_plate_detection=config.enable_plate_detection if hasattr(config, 'enable_plate_detection') else False,
+            batch_size=config.batch_size
 
         )
         
@@ -289,22 +608,24 @@ def process_video_task(video_id: int, config: ProcessingRequest):
         video.processed_at = datetime.utcnow()
         video.speed_limit = config.speed_limit if hasattr(config, 'speed_limit') else 50.0
         db.commit()
+        publish_task_done(video_id, "completed")
         
-        logger.info(f"Video processing completed successfully for ID: {video_id}")
-        logger.info(f"Stats: {stats}")
+        logger.info("Video processing completed successfully for ID: %s", video_id)
+        logger.info("Stats: %s", stats)
         
     except Exception as e:
         error_msg = str(e)
-        logger.error(f"Processing failed for video ID {video_id}: {error_msg}", exc_info=True)
+        logger.error("Processing failed for video ID %s: %s", video_id, error_msg, exc_info=True)
         
         try:
-            video = db.query(Video).filter(Video.id == video_id).first()
+            video = db.get(Video, video_id)
             if video:
                 video.status = "failed"
                 video.error_message = error_msg
                 db.commit()
         except Exception as db_error:
-            logger.error(f"Failed to update video status: {str(db_error)}")
+            logger.error("Failed to update video status: %s", db_error)
+        publish_task_done(video_id, "failed")
     
     finally:
         db.close()  # Always close the session
@@ -325,30 +646,25 @@ def root():
 
 @app.post("/api/videos/upload", response_model=VideoResponse)
 async def upload_video(
+    request: Request,
     file: UploadFile = File(...),
     db: Session = Depends(get_db)
 ):
     """Upload a new video"""
-    logger.info(f"Upload request received: {file.filename} ({file.content_type})")
+    logger.info("Upload request received: %s (%s)", file.filename, file.content_type)
     
     try:
-        # Validate file extension
-        file_ext = Path(file.filename).suffix.lower()
-        
-        if file_ext not in settings.ALLOWED_EXTENSIONS:
-            logger.warning(f"Invalid file extension: {file_ext}")
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid file type. Allowed: {settings.ALLOWED_EXTENSIONS}"
-            )
+        # Reject oversized requests before copying anything into uploads/
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > settings.MAX_FILE_SIZE:
+            logger.warning("Upload too large: %s bytes", content_length)
+            raise _file_too_large()
         
-        logger.debug(f"File extension validated: {file_ext}")
-        
-        # Save file
-        file_path = save_upload_file(file)
+        # Save file (validates the extension before writing anything)
+        file_path = await save_upload_file(file)
         
         # Get video info
-        video_info = get_video_info(file_path)
+        video_info = await run_in_threadpool(get_video_info, file_path)
         
         # Create database record
         video = Video(
@@ -360,24 +676,35 @@ async def upload_video(
             status="uploaded"
         )
         
+        # flush assigns the id (and the Python-side defaults are already set),
+        # so build the response before commit expires the instance - no refresh SELECT
         db.add(video)
+        db.flush()
+        video_id = video.id
+        result = video.to_dict()
         db.commit()
-        db.refresh(video)
         
-        logger.info(f"Video uploaded successfully: ID {video.id}, {file.filename}")
+        # Cache the calibration frame now so /frame never has to decode
+        try:
+            if not await run_in_threadpool(cache_thumbnail, file_path, video_id):
+                thumbnail_path(video_id).unlink(missing_ok=True)
+        except Exception as e:
+            logger.warning("Failed to cache thumbnail for video %s: %s", video_id, e)
         
-        return video.to_dict()
+        logger.info("Video uploaded successfully: ID %s, %s", video_id, file.filename)
+        
+        return result
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Upload failed for {file.filename}: {str(e)}", exc_info=True)
+        logger.error("Upload failed for %s: %s", file.filename, e, exc_info=True)
         
         # Try to clean up file if it was saved
         try:
             if 'file_path' in locals():
                 Path(file_path).unlink(missing_ok=True)
-                logger.debug(f"Cleaned up file: {file_path}")
+                logger.debug("Cleaned up file: %s", file_path)
         except:
             pass
             
@@ -388,40 +715,134 @@ async def upload_video(
 def list_videos(
     skip: int = 0,
     limit: int = 100,
+    after_id: Optional[int] = None,
     db: Session = Depends(get_db)
 ):
-    """Get list of all videos"""
-    logger.debug(f"List videos request: skip={skip}, limit={limit}")
+    """Get list of all videos
+
+    Pass the X-Next-Cursor header value as after_id to fetch the next page;
+    keyset pagination on the primary key costs O(limit) regardless of depth.
+    skip/offset is kept for existing clients.
+    Returns an ORJSONResponse directly: response_model only documents the
+    shape, skipping per-row pydantic validation and jsonable_encoder.
+    """
+    logger.debug("List videos request: skip=%s, limit=%s, after_id=%s", skip, limit, after_id)
     
     try:
-        videos = db.query(Video).offset(skip).limit(limit).all()
-        logger.info(f"Retrieved {len(videos)} videos")
-        return [video.to_dict() for video in videos]
+        # Plain column rows - no ORM identity map or attribute instrumentation
+        stmt = select(*VIDEO_API_COLUMNS).order_by(Video.id)
+        if after_id is not None:
+            stmt = stmt.where(Video.id > after_id)
+        else:
+            stmt = stmt.offset(skip)
+        
+        # Fetch one extra row to know whether another page exists
+        rows = db.execute(stmt.limit(limit + 1)).all()
+        headers = {}
+        if len(rows) > limit:
+            rows = rows[:limit]
+            headers["X-Next-Cursor"] = str(rows[-1].id)
+        
+        logger.info("Retrieved %s videos", len(rows))
+        return ORJSONResponse([video_to_dict(row) for row in rows], headers=headers)
         
     except Exception as e:
-        logger.error(f"Failed to list videos: {str(e)}", exc_info=True)
+        logger.error("Failed to list videos: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to retrieve videos")
 
 
+# Upper bound on ids accepted by the batch status endpoint
+MAX_STATUS_BATCH = 100
+
+
+# Declared before /api/videos/{video_id} so "status" isn't parsed as an id
+@app.get("/api/videos/status", response_model=list[VideoStatusResponse])
+def get_processing_status_batch(ids: str, db: Session = Depends(get_db)):
+    """Get processing status for several videos (ids=1,2,3)
+
+    Task metadata for all active videos is read with a single MGET on the
+    result backend instead of one AsyncResult round-trip per video.
+    Unknown ids are omitted from the result.
+    """
+    try:
+        video_ids = {int(part) for part in ids.split(",") if part.strip()}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+    
+    if len(video_ids) > MAX_STATUS_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_STATUS_BATCH} ids per request")
+    
+    logger.debug("Batch status request for %s videos", len(video_ids))
+    
+    try:
+        rows = db.execute(
+            select(
+                Video.id,
+                Video.status,
+                Video.celery_task_id,
+                Video.processed_frames,
+                Video.total_frames,
+                Video.error_message,
+            )
+            .where(Video.id.in_(video_ids))
+            .order_by(Video.id)
+        ).all()
+        
+        active = [row for row in rows if row.celery_task_id and row.status in ACTIVE_STATUSES]
+        task_meta = {}
+        
+        # Running videos are answered from their progress snapshots
+        progress = get_progress_many([row.id for row in active])
+        for row, snapshot in zip(active, progress):
+            if snapshot is not None:
+                task_meta[row.id] = {"status": "PROCESSING", "result": snapshot}
+        active = [row for row in active if row.id not in task_meta]
+        
+        if active:
+            try:
+                backend = celery_app.backend
+                keys = [backend.get_key_for_task(row.celery_task_id) for row in active]
+                for row, raw in zip(active, backend.client.mget(keys)):
+                    # A missing key is what AsyncResult reports as PENDING
+                    task_meta[row.id] = backend.decode_result(raw) if raw is not None else {"status": "PENDING"}
+            except Exception as e:
+                logger.error("Error checking Celery tasks: %s", e)
+        
+        results = []
+        for row in rows:
+            payload = None
+            meta = task_meta.get(row.id)
+            if meta is not None:
+                payload = _task_status_payload(row, meta.get("status"), meta.get("result"))
+            results.append(payload if payload is not None else _db_status_payload(row))
+        
+        # Polled for many videos at once - skip per-item response_model validation
+        return ORJSONResponse(results)
+        
+    except Exception as e:
+        logger.error("Failed to get batch status: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to retrieve status")
+
+
 @app.get("/api/videos/{video_id}", response_model=VideoResponse)
 def get_video(video_id: int, db: Session = Depends(get_db)):
     """Get video details by ID"""
-    logger.debug(f"Get video request: ID {video_id}")
+    logger.debug("Get video request: ID %s", video_id)
     
     try:
-        video = db.query(Video).filter(Video.id == video_id).first()
+        video = db.get(Video, video_id)
         
         if not video:
-            logger.warning(f"Video not found: ID {video_id}")
+            logger.warning("Video not found: ID %s", video_id)
             raise HTTPException(status_code=404, detail="Video not found")
         
-        logger.debug(f"Video retrieved: {video.filename} (status: {video.status})")
+        logger.debug("Video retrieved: %s (status: %s)", video.filename, video.status)
         return video.to_dict()
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Failed to get video {video_id}: {str(e)}", exc_info=True)
+        logger.error("Failed to get video %s: %s", video_id, e, exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to retrieve video")
 
 
@@ -433,43 +854,50 @@ async def start_processing(
     db: Session = Depends(get_db)
 ):
     """Start video processing using Celery task queue"""
-    logger.info(f"📥 Process request received for video ID: {video_id}")
+    logger.info("📥 Process request received for video ID: %s", video_id)
     
     try:
-        video = db.query(Video).filter(Video.id == video_id).first()
+        video = db.get(Video, video_id)
         
         if not video:
-            logger.warning(f"Video not found: ID {video_id}")
+            logger.warning("Video not found: ID %s", video_id)
             raise HTTPException(status_code=404, detail="Video not found")
         
         if video.status == "processing":
-            logger.warning(f"Video already processing: ID {video_id}")
+            logger.warning("Video already processing: ID %s", video_id)
             raise HTTPException(status_code=400, detail="Video is already being processed")
         
         if video.status == "completed":
-            logger.warning(f"Video already completed: ID {video_id}")
+            logger.warning("Video already completed: ID %s", video_id)
             raise HTTPException(status_code=400, detail="Video already processed")
         
         # Route task to GPU or CPU worker via Celery
-        logger.info(f"🚀 Routing video {video_id} to Celery worker...")
-        task = route_task_to_worker(video_id, config.model_dump(mode="json"))
-        logger.info(f"🚀 Routing video {video_id} to Celery worker...")
-        logger.info(f"[DEBUG] Config being sent to Celery: {config.model_dump()}")
+        logger.info("🚀 Routing video %s to Celery worker...", video_id)
+        task = route_task_to_worker(
+            video_id, config.model_dump(mode="json"), total_frames=video.total_frames
+        )
+        logger.info("🚀 Routing video %s to Celery worker...", video_id)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Config being sent to Celery: %s", config.model_dump())
 
         
-        # Save task ID to database
-        video.status = "queued"
-        video.celery_task_id = task.id
+        # Save task ID to database - one UPDATE, and nothing to reload afterwards
+        total_frames = video.total_frames
+        db.execute(
+            update(Video)
+            .where(Video.id == video_id)
+            .values(status="queued", celery_task_id=task.id)
+        )
         db.commit()
         
-        logger.info(f"✅ Video {video_id} queued. Celery task ID: {task.id}")
+        logger.info("✅ Video %s queued. Celery task ID: %s", video_id, task.id)
         
         return {
-            "id": video.id,
+            "id": video_id,
             "status": "queued",
             "progress": 0,
             "processed_frames": 0,
-            "total_frames": video.total_frames,
+            "total_frames": total_frames,
             "error_message": None,
             "device": "queued",
             "task_id": task.id
@@ -478,206 +906,332 @@ async def start_processing(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Failed to queue processing for video {video_id}: {str(e)}", exc_info=True)
+        logger.error("Failed to queue processing for video %s: %s", video_id, e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to start processing: {str(e)}")
 
 
+ACTIVE_STATUSES = ("queued", "processing")
+
+
+def _progress_payload(video_id: int, task_info: dict, total_frames=None):
+    """Status payload for a running task from its progress info"""
+    return {
+        "id": video_id,
+        "status": "processing",
+        "progress": task_info.get('progress', 0),
+        "processed_frames": task_info.get('current_frame', 0),
+        "total_frames": task_info.get('total_frames', total_frames),
+        "error_message": None,
+        "device": task_info.get('device', 'unknown'),
+        "worker_type": task_info.get('worker_type', 'unknown'),
+        "task_status": 'PROCESSING'
+    }
+
+
+def _task_status_payload(video, state, info):
+    """Status payload from Celery task state/info, or None to fall back to the DB"""
+    if state == 'PROCESSING':
+        return _progress_payload(video.id, info or {}, video.total_frames)
+    elif state == 'PENDING':
+        return {
+            "id": video.id,
+            "status": "queued",
+            "progress": 0,
+            "processed_frames": 0,
+            "total_frames": video.total_frames,
+            "error_message": None,
+            "device": "queued",
+            "task_status": "PENDING"
+        }
+    elif state == 'FAILURE':
+        error = str(info) if info else "Unknown error"
+        return {
+            "id": video.id,
+            "status": "failed",
+            "progress": 0,
+            "processed_frames": video.processed_frames or 0,
+            "error_message": error,
+            "device": "failed",
+            "task_status": "FAILURE"
+        }
+    return None
+
+
+def _db_status_payload(video):
+    """Status payload from the database row alone"""
+    return {
+        "id": video.id,
+        "status": video.status,
+        "progress": calculate_progress(video.status, video.processed_frames, video.total_frames),
+        "processed_frames": video.processed_frames,
+        "total_frames": video.total_frames,
+        "error_message": video.error_message,
+        "device": "cpu" if cuda_available() else "cpu"
+    }
+
+
 @app.get("/api/videos/{video_id}/status", response_model=VideoStatusResponse)
 def get_processing_status(video_id: int, db: Session = Depends(get_db)):
     """Get video processing status from Celery task"""
-    logger.debug(f"Status request for video ID: {video_id}")
+    logger.debug("Status request for video ID: %s", video_id)
     
     try:
-        video = db.query(Video).filter(Video.id == video_id).first()
+        # A snapshot only exists while a worker is processing the video, so
+        # progress polls are answered from Redis plus a PK-only existence check
+        # (a video deleted mid-processing must still 404)
+        progress = get_progress(video_id)
+        if progress is not None:
+            if db.scalar(select(Video.id).where(Video.id == video_id)) is None:
+                logger.warning("Video not found for status check: ID %s", video_id)
+                raise HTTPException(status_code=404, detail="Video not found")
+            return _progress_payload(video_id, progress)
+        
+        video = db.get(Video, video_id)
         
         if not video:
-            logger.warning(f"Video not found for status check: ID {video_id}")
+            logger.warning("Video not found for status check: ID %s", video_id)
             raise HTTPException(status_code=404, detail="Video not found")
         
         # If video has Celery task ID, check task status
-        if video.celery_task_id and video.status in ["queued", "processing"]:
+        if video.celery_task_id and video.status in ACTIVE_STATUSES:
             try:
                 task = AsyncResult(video.celery_task_id, app=celery_app)
-                
-                # Get task state
-                if task.state == 'PROCESSING':
-                    task_info = task.info or {}
-                    return {
-                        "id": video.id,
-                        "status": "processing",
-                        "progress": task_info.get('progress', 0),
-                        "processed_frames": task_info.get('current_frame', 0),
-                        "total_frames": task_info.get('total_frames', video.total_frames),
-                        "error_message": None,
-                        "device": task_info.get('device', 'unknown'),
-                        "worker_type": task_info.get('worker_type', 'unknown'),
-                        "task_status": task.state
-                    }
-                elif task.state == 'PENDING':
-                    return {
-                        "id": video.id,
-                        "status": "queued",
-                        "progress": 0,
-                        "processed_frames": 0,
-                        "total_frames": video.total_frames,
-                        "error_message": None,
-                        "device": "queued",
-                        "task_status": "PENDING"
-                    }
-                elif task.state == 'FAILURE':
-                    error = str(task.info) if task.info else "Unknown error"
-                    return {
-                        "id": video.id,
-                        "status": "failed",
-                        "progress": 0,
-                        "error_message": error,
-                        "device": "failed",
-                        "task_status": "FAILURE"
-                    }
+                payload = _task_status_payload(video, task.state, task.info)
+                if payload is not None:
+                    return payload
             except Exception as e:
-                logger.error(f"Error checking Celery task: {str(e)}")
+                logger.error("Error checking Celery task: %s", e)
         
         # Fallback to database status
-        return {
-            "id": video.id,
-            "status": video.status,
-            "progress": video._calculate_progress(),
-            "processed_frames": video.processed_frames,
-            "total_frames": video.total_frames,
-            "error_message": video.error_message,
-            "device": "cpu" if torch.cuda.is_available() else "cpu"
-        }
+        return _db_status_payload(video)
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Failed to get status for video {video_id}: {str(e)}", exc_info=True)
+        logger.error("Failed to get status for video %s: %s", video_id, e, exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to retrieve status")
 
 
+@app.get("/api/videos/{video_id}/wait", response_model=VideoStatusResponse)
+async def wait_for_processing(
+    video_id: int,
+    timeout: float = 60.0,
+    db: Session = Depends(get_db)
+):
+    """Long-poll until processing finishes (or timeout), then return the status"""
+    logger.debug("Wait request for video ID: %s (timeout=%ss)", video_id, timeout)
+    timeout = max(0.0, min(timeout, MAX_WAIT_TIMEOUT))
+    
+    try:
+        async with get_async_redis().pubsub() as pubsub:
+            # Subscribe before checking the DB so a completion in between isn't missed
+            await pubsub.subscribe(task_done_channel(video_id))
+            
+            # Sync session/Redis/Celery calls stay off the event loop
+            video = await run_in_threadpool(db.get, Video, video_id)
+            if not video:
+                logger.warning("Video not found for wait: ID %s", video_id)
+                raise HTTPException(status_code=404, detail="Video not found")
+            
+            if video.status in ("queued", "processing"):
+                loop = asyncio.get_running_loop()
+                deadline = loop.time() + timeout
+                while (remaining := deadline - loop.time()) > 0:
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True, timeout=remaining
+                    )
+                    if message is not None:
+                        break
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        # Redis unavailable - degrade to an immediate status read
+        logger.error("Wait for video %s failed: %s", video_id, e)
+    
+    return await run_in_threadpool(_fresh_processing_status, video_id, db)
+
+
+def _fresh_processing_status(video_id: int, db: Session):
+    """Status read that ignores rows cached in the session before the wait"""
+    db.expire_all()
+    return get_processing_status(video_id, db)
+
+
 @app.get("/api/videos/{video_id}/download")
 def download_video(video_id: int, db: Session = Depends(get_db)):
     """Download processed video"""
-    logger.info(f"Download request for video ID: {video_id}")
+    logger.info("Download request for video ID: %s", video_id)
     
     try:
-        video = db.query(Video).filter(Video.id == video_id).first()
+        video = db.get(Video, video_id)
         
         if not video:
-            logger.warning(f"Video not found for download: ID {video_id}")
+            logger.warning("Video not found for download: ID %s", video_id)
             raise HTTPException(status_code=404, detail="Video not found")
         
         if video.status != "completed":
-            logger.warning(f"Video not completed for download: ID {video_id} (status: {video.status})")
+            logger.warning("Video not completed for download: ID %s (status: %s)", video_id, video.status)
             raise HTTPException(status_code=400, detail="Video processing not completed")
         
-        if not video.processed_path or not Path(video.processed_path).exists():
-            logger.error(f"Processed file not found: {video.processed_path}")
+        # One stat both checks existence and is reused by the response
+        try:
+            stat_result = os.stat(video.processed_path) if video.processed_path else None
+        except OSError:
+            stat_result = None
+        
+        if stat_result is None:
+            logger.error("Processed file not found: %s", video.processed_path)
             raise HTTPException(status_code=404, detail="Processed video file not found")
         
-        logger.info(f"Serving download for video ID {video_id}: {video.processed_path}")
+        logger.info("Serving download for video ID %s: %s", video_id, video.processed_path)
         
-        return FileResponse(
+        return LargeFileResponse(
             path=video.processed_path,
             media_type="video/mp4",
-            filename=f"processed_{video.filename}"
+            filename=f"processed_{video.filename}",
+            stat_result=stat_result
         )
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Failed to download video {video_id}: {str(e)}", exc_info=True)
+        logger.error("Failed to download video %s: %s", video_id, e, exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to download video")
 
 
+def _unlink_quietly(path, label: str):
+    """Delete a file if present, logging instead of raising on failure"""
+    try:
+        Path(path).unlink(missing_ok=True)
+        logger.debug("Deleted %s file: %s", label, path)
+    except Exception as e:
+        logger.warning("Failed to delete %s file: %s", label, e)
+
+
+def _delete_video_row(db: Session, video: Video):
+    """Delete the video row (detections cascade)"""
+    db.delete(video)
+    db.commit()
+
+
 @app.delete("/api/videos/{video_id}")
-def delete_video(video_id: int, db: Session = Depends(get_db)):
+async def delete_video(video_id: int, db: Session = Depends(get_db)):
     """Delete video and associated files"""
-    logger.info(f"Delete request for video ID: {video_id}")
+    logger.info("Delete request for video ID: %s", video_id)
     
     try:
-        video = db.query(Video).filter(Video.id == video_id).first()
+        video = await run_in_threadpool(db.get, Video, video_id)
         
         if not video:
-            logger.warning(f"Video not found for deletion: ID {video_id}")
+            logger.warning("Video not found for deletion: ID %s", video_id)
             raise HTTPException(status_code=404, detail="Video not found")
         
         filename = video.filename
         
-        # Delete files
-        if video.original_path:
-            try:
-                Path(video.original_path).unlink(missing_ok=True)
-                logger.debug(f"Deleted original file: {video.original_path}")
-            except Exception as e:
-                logger.warning(f"Failed to delete original file: {str(e)}")
-                
-        if video.processed_path:
-            try:
-                Path(video.processed_path).unlink(missing_ok=True)
-                logger.debug(f"Deleted processed file: {video.processed_path}")
-            except Exception as e:
-                logger.warning(f"Failed to delete processed file: {str(e)}")
-        
-        # Delete database record
-        db.delete(video)
-        db.commit()
+        # SQLite may reuse the id, so the cached frame must go too
+        files = [
+            (video.original_path, "original"),
+            (video.processed_path, "processed"),
+            (thumbnail_path(video_id), "thumbnail"),
+        ]
+        
+        # Files, the progress snapshot and the database record are independent -
+        # remove them concurrently
+        await asyncio.gather(
+            *(run_in_threadpool(_unlink_quietly, path, label) for path, label in files if path),
+            run_in_threadpool(clear_progress, video_id),
+            run_in_threadpool(_delete_video_row, db, video),
+        )
         
-        logger.info(f"Video deleted successfully: ID {video_id}, {filename}")
+        logger.info("Video deleted successfully: ID %s, %s", video_id, filename)
         
         return {"message": "Video deleted successfully"}
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Failed to delete video {video_id}: {str(e)}", exc_info=True)
+        logger.error("Failed to delete video %s: %s", video_id, e, exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to delete video")
 
 
+# Dashboards poll the summary; serve one computed result for this long
+ANALYTICS_CACHE_TTL = 2.0
+_analytics_cache = None  # (expires_at, summary)
+
+
+def _compute_analytics_summary(db: Session):
+    """Aggregate the analytics summary in one SQL query"""
+    # Processing duration in seconds, per dialect
+    if db.get_bind().dialect.name == "sqlite":
+        processing_seconds = (
+            func.julianday(Video.processed_at) - func.julianday(Video.uploaded_at)
+        ) * 86400.0
+    else:
+        processing_seconds = func.extract("epoch", Video.processed_at - Video.uploaded_at)
+    
+    def count_status(status):
+        return func.coalesce(func.sum(case((Video.status == status, 1), else_=0)), 0)
+    
+    # Single aggregate query instead of loading every row into Python
+    (
+        total_videos,
+        processing_videos,
+        completed_videos,
+        failed_videos,
+        total_vehicles,
+        avg_processing_time,
+    ) = db.query(
+        func.count(Video.id),
+        count_status("processing"),
+        count_status("completed"),
+        count_status("failed"),
+        func.coalesce(func.sum(Video.vehicle_count), 0),
+        func.avg(case(
+            (
+                and_(
+                    Video.status == "completed",
+                    Video.uploaded_at.isnot(None),
+                    Video.processed_at.isnot(None),
+                ),
+                processing_seconds,
+            ),
+            else_=None,
+        )),
+    ).one()
+    
+    if avg_processing_time is not None:
+        avg_processing_time = float(avg_processing_time)
+    
+    logger.info("Analytics: %s total, %s completed, %s vehicles detected", total_videos, completed_videos, total_vehicles)
+    
+    return {
+        "total_videos": total_videos,
+        "processing_videos": processing_videos,
+        "completed_videos": completed_videos,
+        "failed_videos": failed_videos,
+        "total_vehicles_detected": total_vehicles,
+        "avg_processing_time": avg_processing_time
+    }
+
+
 @app.get("/api/analytics/summary", response_model=AnalyticsSummary)
 def get_analytics_summary(db: Session = Depends(get_db)):
     """Get analytics summary"""
+    global _analytics_cache
     logger.debug("Analytics summary requested")
     
     try:
-        total_videos = db.query(Video).count()
-        processing_videos = db.query(Video).filter(Video.status == "processing").count()
-        completed_videos = db.query(Video).filter(Video.status == "completed").count()
-        failed_videos = db.query(Video).filter(Video.status == "failed").count()
-        
-        # Total vehicles detected
-        result = db.query(Video).filter(Video.vehicle_count.isnot(None)).all()
-        total_vehicles = sum(v.vehicle_count for v in result)
-        
-        # Average processing time
-        completed = db.query(Video).filter(
-            Video.status == "completed",
-            Video.uploaded_at.isnot(None),
-            Video.processed_at.isnot(None)
-        ).all()
-        
-        if completed:
-            processing_times = [
-                (v.processed_at - v.uploaded_at).total_seconds()
-                for v in completed
-            ]
-            avg_processing_time = sum(processing_times) / len(processing_times)
-        else:
-            avg_processing_time = None
+        now = time.monotonic()
+        if _analytics_cache is not None and _analytics_cache[0] > now:
+            return _analytics_cache[1]
         
-        logger.info(f"Analytics: {total_videos} total, {completed_videos} completed, {total_vehicles} vehicles detected")
-        
-        return {
-            "total_videos": total_videos,
-            "processing_videos": processing_videos,
-            "completed_videos": completed_videos,
-            "failed_videos": failed_videos,
-            "total_vehicles_detected": total_vehicles,
-            "avg_processing_time": avg_processing_time
-        }
+        summary = _compute_analytics_summary(db)
+        _analytics_cache = (now + ANALYTICS_CACHE_TTL, summary)
+        return summary
         
     except Exception as e:
-        logger.error(f"Failed to get analytics: {str(e)}", exc_info=True)
+        logger.error("Failed to get analytics: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to retrieve analytics")
 
 # ADD THESE NEW ENDPOINTS TO YOUR EXISTING main.py
@@ -694,13 +1248,13 @@ async def calibrate_video(
     The frontend sends exactly four points clicked on a calibration frame
     plus a known real-world distance in meters.
     """
-    logger.info(f"Calibration request for video ID: {video_id}")
+    logger.info("Calibration request for video ID: %s", video_id)
 
     try:
-        video = db.query(Video).filter(Video.id == video_id).first()
+        video = db.get(Video, video_id)
 
         if not video:
-            logger.warning(f"Video not found for calibration: ID {video_id}")
+            logger.warning("Video not found for calibration: ID %s", video_id)
             raise HTTPException(status_code=404, detail="Video not found")
 
         points = calibration_request.points or []
@@ -708,19 +1262,21 @@ async def calibrate_video(
         approximate = getattr(calibration_request, "approximate", False)
 
         if len(points) != 4:
-            logger.warning(f"Invalid calibration points for video {video_id}: expected 4, got {len(points)}")
+            logger.warning("Invalid calibration points for video %s: expected 4, got %s", video_id, len(points))
             raise HTTPException(status_code=400, detail="Exactly 4 calibration points are required")
 
         if reference_distance <= 0:
             if approximate:
                 # Use a sensible default for approximate mode instead of failing
                 logger.warning(
-                    f"Approximate calibration with non-positive reference distance for video {video_id}: "
-                    f"{reference_distance} - defaulting to 150.0m"
+                    "Approximate calibration with non-positive reference distance for video %s: "
+                    "%s - defaulting to 150.0m",
+                    video_id,
+                    reference_distance,
                 )
                 reference_distance = 150.0
             else:
-                logger.warning(f"Invalid reference distance for video {video_id}: {reference_distance}")
+                logger.warning("Invalid reference distance for video %s: %s", video_id, reference_distance)
                 raise HTTPException(status_code=400, detail="Reference distance must be positive")
 
         # Prepare calibration payload for storage
@@ -744,9 +1300,11 @@ async def calibrate_video(
         db.commit()
 
         logger.info(
-            f"Video {video_id} calibrated successfully with 4-point perspective; "
-            f"reference_distance={reference_distance}m, "
-            f"approximate={approximate}"
+            "Video %s calibrated successfully with 4-point perspective; "
+            "reference_distance=%sm, approximate=%s",
+            video_id,
+            reference_distance,
+            approximate,
         )
 
         return {
@@ -758,7 +1316,7 @@ async def calibrate_video(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Calibration failed for video {video_id}: {str(e)}", exc_info=True)
+        logger.error("Calibration failed for video %s: %s", video_id, e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"Calibration failed: {str(e)}")
 
 
@@ -768,10 +1326,10 @@ async def get_calibration(
     db: Session = Depends(get_db)
 ):
     """Get calibration data for a video"""
-    logger.debug(f"Get calibration request for video ID: {video_id}")
+    logger.debug("Get calibration request for video ID: %s", video_id)
     
     try:
-        video = db.query(Video).filter(Video.id == video_id).first()
+        video = db.get(Video, video_id)
         
         if not video:
             raise HTTPException(status_code=404, detail="Video not found")
@@ -786,7 +1344,7 @@ async def get_calibration(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Failed to get calibration for video {video_id}: {str(e)}", exc_info=True)
+        logger.error("Failed to get calibration for video %s: %s", video_id, e, exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to retrieve calibration")
 
 
@@ -796,10 +1354,10 @@ async def delete_calibration(
     db: Session = Depends(get_db)
 ):
     """Delete calibration data for a video"""
-    logger.info(f"Delete calibration request for video ID: {video_id}")
+    logger.info("Delete calibration request for video ID: %s", video_id)
     
     try:
-        video = db.query(Video).filter(Video.id == video_id).first()
+        video = db.get(Video, video_id)
         
         if not video:
             raise HTTPException(status_code=404, detail="Video not found")
@@ -808,14 +1366,14 @@ async def delete_calibration(
         video.calibrated_at = None
         db.commit()
         
-        logger.info(f"Calibration deleted for video ID: {video_id}")
+        logger.info("Calibration deleted for video ID: %s", video_id)
         
         return {"message": "Calibration deleted successfully"}
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Failed to delete calibration for video {video_id}: {str(e)}", exc_info=True)
+        logger.error("Failed to delete calibration for video %s: %s", video_id, e, exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to delete calibration")
 
 
@@ -828,46 +1386,32 @@ def get_video_frame(
 
     Used by the frontend calibration page to let the user click 4 points.
     """
-    logger.debug(f"Frame request for video ID: {video_id}")
+    logger.debug("Frame request for video ID: %s", video_id)
 
     try:
-        video = db.query(Video).filter(Video.id == video_id).first()
+        video = db.get(Video, video_id)
 
         if not video:
-            logger.warning(f"Video not found for frame extraction: ID {video_id}")
+            logger.warning("Video not found for frame extraction: ID %s", video_id)
             raise HTTPException(status_code=404, detail="Video not found")
 
-        if not video.original_path or not Path(video.original_path).exists():
-            logger.error(f"Original video file not found for frame extraction: {video.original_path}")
-            raise HTTPException(status_code=404, detail="Original video file not found")
-
-        # Lazy import to avoid heavy deps at startup
-        import cv2  # type: ignore
-
-        cap = cv2.VideoCapture(video.original_path)
-        if not cap.isOpened():
-            logger.error(f"Failed to open video file for frame extraction: {video.original_path}")
-            raise HTTPException(status_code=500, detail="Cannot open video file")
-
-        success, frame = cap.read()
-        cap.release()
-
-        if not success or frame is None:
-            logger.error(f"Failed to read frame from video: {video.original_path}")
-            raise HTTPException(status_code=500, detail="Cannot read frame from video")
-
-        success, buffer = cv2.imencode(".jpg", frame)
-        if not success:
-            logger.error("Failed to encode video frame as JPEG")
-            raise HTTPException(status_code=500, detail="Failed to encode video frame")
+        thumb = thumbnail_path(video_id)
+        if not thumb.exists():
+            # Cache miss (uploaded before caching existed) - extract once
+            if not video.original_path or not Path(video.original_path).exists():
+                logger.error("Original video file not found for frame extraction: %s", video.original_path)
+                raise HTTPException(status_code=404, detail="Original video file not found")
+            
+            if not cache_thumbnail(video.original_path, video_id):
+                raise HTTPException(status_code=500, detail="Cannot read frame from video")
 
-        logger.debug(f"Returning JPEG frame for video ID {video_id}")
-        return Response(content=buffer.tobytes(), media_type="image/jpeg")
+        logger.debug("Returning JPEG frame for video ID %s", video_id)
+        return FileResponse(path=thumb, media_type="image/jpeg")
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Failed to extract frame for video {video_id}: {str(e)}", exc_info=True)
+        logger.error("Failed to extract frame for video %s: %s", video_id, e, exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to extract video frame")
 
 @app.get("/api/videos/{video_id}/detections", response_model=list[VehicleDetectionResponse])
@@ -889,45 +1433,80 @@ def get_video_detections(video_id: int, db: Session = Depends(get_db)):
 
         output.append(item)
 
-    return output
+    # Plain dicts straight to orjson - no per-item response_model validation
+    return ORJSONResponse(output)
+
+REPORT_HEADER = ['Vehicle ID', 'Time (s)', 'Frame', 'Speed (km/h)', 'Speed Limit (km/h)', 'Status', 'Plate', 'Snapshot']
+REPORT_BATCH_ROWS = 1000
+
+
+def _iter_report_csv(video_id: int):
+    """Yield the CSV report one batch of detections at a time
+
+    Uses its own session: the request's session is closed before a
+    StreamingResponse body is iterated.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(REPORT_HEADER)
+    yield buffer.getvalue()
+    
+    db = SessionLocal()
+    try:
+        # yield_per streams rows from the cursor instead of loading them all
+        result = db.execute(
+            select(
+                VehicleDetection.track_id,
+                VehicleDetection.timestamp,
+                VehicleDetection.frame_number,
+                VehicleDetection.speed,
+                Video.speed_limit,
+                VehicleDetection.is_speeding,
+                VehicleDetection.number_plate,
+                VehicleDetection.snapshot_path,
+            )
+            .join(Video, VehicleDetection.video_id == Video.id)
+            .where(Video.id == video_id)
+            .execution_options(yield_per=REPORT_BATCH_ROWS)
+        )
+        for rows in result.partitions():
+            buffer.seek(0)
+            buffer.truncate()
+            # One writerows call per batch; basename avoids a Path object per row
+            writer.writerows(
+                (
+                    track_id,
+                    f"{timestamp:.2f}",
+                    frame_number,
+                    f"{speed:.1f}",
+                    row_speed_limit,
+                    "Speeding" if is_speeding else "Normal",
+                    number_plate or "",
+                    os.path.basename(snapshot_path) if snapshot_path else "",
+                )
+                for (
+                    track_id, timestamp, frame_number, speed, row_speed_limit,
+                    is_speeding, number_plate, snapshot_path,
+                ) in rows
+            )
+            yield buffer.getvalue()
+    finally:
+        db.close()
+
 
 @app.get("/api/videos/{video_id}/report/csv")
 def download_report(video_id: int, db: Session = Depends(get_db)):
     """Generate and download CSV report"""
-    logger.info(f"Report download request for video ID: {video_id}")
+    logger.info("Report download request for video ID: %s", video_id)
     
     try:
-        video = db.query(Video).filter(Video.id == video_id).first()
+        # Only the filename is needed here; speed_limit is joined into the row query
+        video = db.execute(select(Video.filename).where(Video.id == video_id)).first()
         if not video:
             raise HTTPException(status_code=404, detail="Video not found")
             
-        detections = db.query(VehicleDetection).filter(VehicleDetection.video_id == video_id).all()
-        
-        # Create CSV in memory
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow(['Vehicle ID', 'Time (s)', 'Frame', 'Speed (km/h)', 'Speed Limit (km/h)', 'Status', 'Plate', 'Snapshot'])        
-        # Write data
-        for d in detections:
-            status = "Speeding" if d.is_speeding else "Normal"
-            writer.writerow([
-            d.track_id,
-            f"{d.timestamp:.2f}",
-            d.frame_number,
-            f"{d.speed:.1f}",
-            video.speed_limit,
-            status,
-            d.number_plate or "",
-            Path(d.snapshot_path).name if d.snapshot_path else ""
-        ])
-
-            
-        output.seek(0)
-        
-        return Response(
-            content=output.getvalue(),
+        return StreamingResponse(
+            _iter_report_csv(video_id),
             media_type="text/csv",
             headers={
                 "Content-Disposition": f"attachment; filename=report_{video.filename}_{datetime.now().strftime('%Y%m%d')}.csv"
@@ -937,7 +1516,7 @@ def download_report(video_id: int, db: Session = Depends(get_db)):
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Failed to generate report for video {video_id}: {str(e)}", exc_info=True)
+        logger.error("Failed to generate report for video %s: %s", video_id, e, exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to generate report")
 
 
@@ -962,16 +1541,36 @@ def get_system_status_endpoint():
         return status
         
     except Exception as e:
-        logger.error(f"Failed to get system status: {str(e)}")
+        logger.error("Failed to get system status: %s", e)
         return {
             "error": str(e),
             "redis_connected": False,
             "gpu_available": False
         }
 
-from fastapi.staticfiles import StaticFiles
-
-app.mount("/snapshots", StaticFiles(directory="processed/snapshots"), name="snapshots")
+@app.get("/snapshots/{filename}")
+def get_snapshot(filename: str):
+    """Serve a vehicle snapshot JPEG"""
+    # Snapshots live directly in SNAPSHOT_DIR - reject anything path-like
+    if Path(filename).name != filename:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    
+    path = SNAPSHOT_DIR / filename
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    # "." / ".." and subdirectories stat fine but can't be sent as a file
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    
+    # Snapshot names are timestamped and never rewritten
+    return FileResponse(
+        path=path,
+        media_type="image/jpeg",
+        stat_result=stat_result,
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
+    )
 
 
 @app.get("/api/health")
@@ -981,5 +1580,5 @@ def health_check():
     return {
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat(),
-        "cuda_available": torch.cuda.is_available()
+        "cuda_available": cuda_available()
     }
\ No newline at end of file
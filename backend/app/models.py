@@ -1,7 +1,7 @@
 """
 SQLAlchemy database models with calibration support
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, JSON, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, JSON, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -22,7 +22,7 @@ class Video(Base):
     celery_task_id = Column(String, nullable=True)
     
     # Processing status
-    status = Column(String, default="uploaded", nullable=False)
+    status = Column(String, default="uploaded", nullable=False, index=True)
     
     # Video metadata
     fps = Column(Integer, nullable=True)
@@ -43,7 +43,7 @@ class Video(Base):
     calibration_data = Column(JSON, nullable=True)
     
     # Timestamps
-    uploaded_at = Column(DateTime, default=datetime.utcnow)
+    uploaded_at = Column(DateTime, default=datetime.utcnow, index=True)
     processed_at = Column(DateTime, nullable=True)
     calibrated_at = Column(DateTime, nullable=True)
     
@@ -53,49 +53,96 @@ class Video(Base):
     # Relationships
     detections = relationship("VehicleDetection", back_populates="video", cascade="all, delete-orphan")
     
+    __table_args__ = (
+        # Partial index covering the analytics processing-time aggregate
+        Index(
+            "ix_videos_completed_times",
+            "uploaded_at",
+            "processed_at",
+            sqlite_where=status == "completed",
+            postgresql_where=status == "completed",
+        ),
+    )
+    
     def __repr__(self):
         return f"<Video(id={self.id}, filename={self.filename}, status={self.status})>"
     
     def to_dict(self):
         """Convert model to dictionary for API responses"""
-        return {
-            "id": self.id,
-            "filename": self.filename,
-            "status": self.status,
-            "fps": self.fps,
-            "duration": self.duration,
-            "total_frames": self.total_frames,
-            "processed_frames": self.processed_frames,
-            "vehicle_count": self.vehicle_count,
-            "avg_speed": self.avg_speed,
-            "max_speed": self.max_speed,
-            "min_speed": self.min_speed,
-            "speed_limit": self.speed_limit,
-            "uploaded_at": self.uploaded_at.isoformat() if self.uploaded_at else None,
-            "processed_at": self.processed_at.isoformat() if self.processed_at else None,
-            "calibrated_at": self.calibrated_at.isoformat() if self.calibrated_at else None,
-            "error_message": self.error_message,
-            "progress": self._calculate_progress(),
-            "calibration_data": self.calibration_data,
-            "is_calibrated": self.calibration_data is not None and self.calibration_data.get("calibrated", False)
-        }
+        return video_to_dict(self)
     
     def _calculate_progress(self):
         """Calculate processing progress percentage"""
-        if self.status == "completed":
-            return 100
-        if self.status == "failed":
-            return 0
-        if self.total_frames and self.processed_frames:
-            return int((self.processed_frames / self.total_frames) * 100)
+        return calculate_progress(self.status, self.processed_frames, self.total_frames)
+
+
+def calculate_progress(status, processed_frames, total_frames):
+    """Calculate processing progress percentage"""
+    if status == "completed":
+        return 100
+    if status == "failed":
         return 0
+    if total_frames and processed_frames:
+        return int((processed_frames / total_frames) * 100)
+    return 0
+
+
+def video_to_dict(v):
+    """
+    API representation of a video
+    Accepts a Video instance or a Row selected with VIDEO_API_COLUMNS
+    Timestamps stay datetime objects; orjson/pydantic encode them as ISO 8601
+    """
+    return {
+        "id": v.id,
+        "filename": v.filename,
+        "status": v.status,
+        "fps": v.fps,
+        "duration": v.duration,
+        "total_frames": v.total_frames,
+        "processed_frames": v.processed_frames,
+        "vehicle_count": v.vehicle_count,
+        "avg_speed": v.avg_speed,
+        "max_speed": v.max_speed,
+        "min_speed": v.min_speed,
+        "speed_limit": v.speed_limit,
+        "uploaded_at": v.uploaded_at,
+        "processed_at": v.processed_at,
+        "calibrated_at": v.calibrated_at,
+        "error_message": v.error_message,
+        "progress": calculate_progress(v.status, v.processed_frames, v.total_frames),
+        "calibration_data": v.calibration_data,
+        "is_calibrated": v.calibration_data is not None and v.calibration_data.get("calibrated", False)
+    }
+
+
+# Columns read by video_to_dict - select these to skip ORM hydration
+VIDEO_API_COLUMNS = (
+    Video.id,
+    Video.filename,
+    Video.status,
+    Video.fps,
+    Video.duration,
+    Video.total_frames,
+    Video.processed_frames,
+    Video.vehicle_count,
+    Video.avg_speed,
+    Video.max_speed,
+    Video.min_speed,
+    Video.speed_limit,
+    Video.uploaded_at,
+    Video.processed_at,
+    Video.calibrated_at,
+    Video.error_message,
+    Video.calibration_data,
+)
 
 
 class VehicleDetection(Base):
     __tablename__ = "vehicle_detections"
     
     id = Column(Integer, primary_key=True, index=True)
-    video_id = Column(Integer, ForeignKey("videos.id"), nullable=False)
+    video_id = Column(Integer, ForeignKey("videos.id"), nullable=False, index=True)
     
     track_id = Column(Integer, nullable=False)
     timestamp = Column(Float, nullable=False)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 
@@ -17,9 +17,9 @@ class VideoResponse(VideoBase):
     max_speed: Optional[float] = None
     min_speed: Optional[float] = None
     speed_limit: Optional[float] = 80.0
-    uploaded_at: Optional[str] = None
-    processed_at: Optional[str] = None
-    calibrated_at: Optional[str] = None
+    uploaded_at: Optional[datetime] = None
+    processed_at: Optional[datetime] = None
+    calibrated_at: Optional[datetime] = None
     error_message: Optional[str] = None
     progress: int = 0
     calibration_data: Optional[Dict[str, Any]] = None
@@ -51,6 +51,7 @@ class ProcessingRequest(BaseModel):
     enable_speed_calculation: bool = True
     speed_limit: float = 80.0  # Default speed limit
     enable_plate_detection: bool = False
+    batch_size: Optional[int] = Field(None, ge=1, le=64)  # frames per forward pass; None = server default
     model_config = {"extra": "allow"}
 
 
@@ -1,6 +1,7 @@
 """
 Zone-Based Speed Estimation with Perspective Correction
 """
+from collections import OrderedDict
 import numpy as np
 import cv2
 import logging
@@ -8,6 +9,63 @@ import logging
 logger = logging.getLogger("projectcars")
 
 
+class TrajectoryBuffer:
+    """
+    Fixed-length (x, y) history kept as a ring buffer in one ndarray
+    Every point is written twice (i and i + capacity), so the last `capacity`
+    points are always one contiguous slice in time order - no copy on read
+    """
+    
+    __slots__ = ("_buf", "_capacity", "_count")
+    
+    def __init__(self, capacity):
+        self._capacity = max(1, int(capacity))
+        self._buf = np.empty((2 * self._capacity, 2), dtype=np.float32)
+        self._count = 0
+    
+    def append(self, point):
+        i = self._count % self._capacity
+        self._buf[i] = point
+        self._buf[i + self._capacity] = point
+        self._count += 1
+    
+    def __len__(self):
+        return min(self._count, self._capacity)
+    
+    def view(self):
+        """(N, 2) float32 view of the stored points, oldest first"""
+        start = self._count % self._capacity if self._count >= self._capacity else 0
+        return self._buf[start:start + len(self)]
+
+
+class TrajectoryStore:
+    """
+    TrajectoryBuffers keyed by tracker id, bounded to max_tracks entries
+    Tracks touched every frame stay at the MRU end, so eviction drops tracks
+    ByteTrack has already lost instead of keeping them for the whole video
+    """
+    
+    def __init__(self, capacity, max_tracks=256):
+        self._capacity = capacity
+        self._max_tracks = max_tracks
+        self._tracks = OrderedDict()
+    
+    def append(self, tracker_id, point):
+        """Add a point to a track's history and return its buffer"""
+        buffer = self._tracks.get(tracker_id)
+        if buffer is None:
+            buffer = self._tracks[tracker_id] = TrajectoryBuffer(self._capacity)
+            if len(self._tracks) > self._max_tracks:
+                self._tracks.popitem(last=False)
+        else:
+            self._tracks.move_to_end(tracker_id)
+        buffer.append(point)
+        return buffer
+    
+    def __len__(self):
+        return len(self._tracks)
+
+
 class ZonedSpeedEstimator:
     """
     Advanced speed estimation using multiple calibrated zones
@@ -23,6 +81,7 @@ class ZonedSpeedEstimator:
         """
         self.zones = []
         self.is_calibrated = False
+        self._scale_profile = None
         
         if calibration_data:
             self.load_calibration(calibration_data)
@@ -45,6 +104,7 @@ class ZonedSpeedEstimator:
         
         # Sort zones by y_min for efficient lookup
         self.zones.sort(key=lambda z: z['y_range'][0])
+        self._scale_profile = None
         
         self.is_calibrated = True
         logger.info(f"Calibration loaded: {len(self.zones)} zones")
@@ -75,6 +135,7 @@ class ZonedSpeedEstimator:
         }
         
         self.zones.append(zone)
+        self._scale_profile = None
         self.is_calibrated = True
         
         logger.info(f"Zone '{name}' added: y={y_min}-{y_max}, scale={pixels_per_meter:.2f} px/m")
@@ -124,44 +185,55 @@ class ZonedSpeedEstimator:
         # Fallback
         return self.zones[0]['pixels_per_meter']
     
+    def get_scales_for_positions(self, y_positions):
+        """
+        Vectorized get_scale_for_position over an array of Y positions
+        Constant inside a zone, linear across gaps and clamped outside all
+        zones - exactly np.interp over the zone edges when zones are ordered
+        """
+        y_positions = np.asarray(y_positions, dtype=np.float64)
+        if not self.zones:
+            logger.warning("No zones configured, using default scale")
+            return np.full(y_positions.shape, 25.0)
+        
+        if self._scale_profile is None:
+            # Zones only change on load/add, so build the interp profile once
+            edges = np.array([z['y_range'] for z in self.zones], dtype=np.float64).ravel()
+            scales = np.repeat([z['pixels_per_meter'] for z in self.zones], 2).astype(np.float64)
+            self._scale_profile = (edges, scales, bool(np.all(np.diff(edges) >= 0)))
+        
+        edges, scales, monotonic = self._scale_profile
+        if monotonic:
+            return np.interp(y_positions, edges, scales)
+        
+        # Overlapping or unsorted zones: keep the first-match lookup
+        return np.array([self.get_scale_for_position(y) for y in y_positions])
+    
     def estimate_speed(self, trajectory_points, fps):
         """
         Estimate speed from vehicle trajectory with perspective correction
         
         Args:
-            trajectory_points: List of (x, y) points tracked over time
+            trajectory_points: (x, y) points tracked over time - a list or an (N, 2) array
             fps: Frames per second of video
             
         Returns:
             Speed in km/h or None if cannot calculate
         """
-        if not trajectory_points or len(trajectory_points) < 2:
+        if trajectory_points is None or len(trajectory_points) < 2:
             return None
         
         if not self.is_calibrated:
             logger.warning("Speed estimation attempted without calibration")
             return None
         
-        # Calculate distance segment by segment
-        total_distance = 0.0
-        
-        for i in range(len(trajectory_points) - 1):
-            p1 = trajectory_points[i]
-            p2 = trajectory_points[i + 1]
-            
-            # Get scale for this segment (use midpoint Y)
-            mid_y = (p1[1] + p2[1]) / 2
-            scale = self.get_scale_for_position(mid_y)
-            
-            # Calculate segment distance in pixels
-            pixel_dist = np.sqrt(
-                (p2[0] - p1[0])**2 + 
-                (p2[1] - p1[1])**2
-            )
-            
-            # Convert to meters
-            segment_distance = pixel_dist / scale
-            total_distance += segment_distance
+        # Distance of every segment at once, each converted with the scale
+        # at its midpoint Y
+        points = np.asarray(trajectory_points, dtype=np.float64)
+        deltas = np.diff(points, axis=0)
+        pixel_dist = np.hypot(deltas[:, 0], deltas[:, 1])
+        mid_y = (points[:-1, 1] + points[1:, 1]) / 2
+        total_distance = float(np.sum(pixel_dist / self.get_scales_for_positions(mid_y)))
         
         # Calculate time in seconds
         time_seconds = len(trajectory_points) / fps
@@ -252,7 +324,7 @@ class SimpleFallbackEstimator:
     
     def estimate_speed(self, trajectory_points, fps):
         """Simple speed estimation without zones"""
-        if not trajectory_points or len(trajectory_points) < 2:
+        if trajectory_points is None or len(trajectory_points) < 2:
             return None
         
         start = trajectory_points[0]
@@ -334,13 +406,14 @@ class FourPointSpeedEstimator:
     def estimate_speed(self, trajectory_points, fps):
         if not self.is_calibrated or self.transform_matrix is None:
             return None
-        if not trajectory_points or len(trajectory_points) < 2:
+        if trajectory_points is None or len(trajectory_points) < 2:
             return None
         if fps <= 0:
             return None
 
         try:
-            pts = np.array(trajectory_points, dtype=np.float32)
+            # Only the end points feed the distance, so warp just those two
+            pts = np.asarray(trajectory_points, dtype=np.float32)[[0, -1]]
             pts = pts.reshape(-1, 1, 2)
             transformed = cv2.perspectiveTransform(pts, self.transform_matrix)
             transformed = transformed.reshape(-1, 2)
@@ -3,7 +3,14 @@ Celery tasks for video processing (Python 3.10 compatible)
 """
 from celery import Task
 from typing import Dict, Any
-from .celery_app import celery_app, mark_gpu_busy
+from .celery_app import (
+    celery_app,
+    release_gpu_for_next,
+    publish_progress,
+    publish_task_done,
+    cuda_available,
+    cuda_device_name,
+)
 from .database import SessionLocal
 from .models import Video
 from .video_processor import VideoProcessor
@@ -11,10 +18,21 @@ from .config import settings
 from pathlib import Path
 from datetime import datetime
 import logging
-import torch
+import time
 
 logger = logging.getLogger("projectcars")
 
+# Minimum seconds between progress snapshots (2 Hz)
+PROGRESS_PUBLISH_INTERVAL = 0.5
+
+# Frames between processed_frames checkpoints in the database
+PROGRESS_DB_INTERVAL_FRAMES = 250
+
+# Hard/soft limits for one video - above the app-wide 30 min default,
+# long uploads legitimately run close to an hour
+VIDEO_TASK_TIME_LIMIT = 60 * 60
+VIDEO_TASK_SOFT_TIME_LIMIT = VIDEO_TASK_TIME_LIMIT - 100
+
 
 class DatabaseTask(Task):
     """Base task with database session"""
@@ -31,19 +49,40 @@ class DatabaseTask(Task):
             self._db.close()
 
 
-@celery_app.task(bind=True, base=DatabaseTask, name='app.tasks.process_video_gpu')
+# Video tasks run for minutes, so workers must not reserve a second one while
+# busy (prefork, --prefetch-multiplier=1; see app/celery_app.py). acks_late
+# keeps the message unacked until the run ends, so it is redelivered if the
+# worker goes away mid-video.
+@celery_app.task(
+    bind=True,
+    base=DatabaseTask,
+    name='app.tasks.process_video_gpu',
+    acks_late=True,
+    time_limit=VIDEO_TASK_TIME_LIMIT,
+    soft_time_limit=VIDEO_TASK_SOFT_TIME_LIMIT,
+)
 def process_video_gpu(self, video_id: int, config: Dict[str, Any]):
     """Process video using GPU (CUDA)"""
     logger.info(f"[GPU Worker] Starting video {video_id}")
     
+    # Release exactly once - after an early release another dispatch may own the lock
+    gpu_released = False
+    
+    def release_gpu():
+        nonlocal gpu_released
+        if not gpu_released:
+            gpu_released = True
+            release_gpu_for_next()
+            logger.info(f"[GPU Worker] Video {video_id} inference finished - GPU marked as FREE")
+    
     try:
         # Verify CUDA is available
-        if not torch.cuda.is_available():
+        if not cuda_available():
             logger.error("[GPU Worker] CUDA not available! Failing task.")
             raise RuntimeError("CUDA not available for GPU worker")
         
         device = 'cuda'
-        gpu_name = torch.cuda.get_device_name(0)
+        gpu_name = cuda_device_name()
         logger.info(f"[GPU Worker] Using device: {device} ({gpu_name})")
         logger.info(f"[CELERY RECEIVED CONFIG] {config}")
         # Process video
@@ -52,18 +91,25 @@ def process_video_gpu(self, video_id: int, config: Dict[str, Any]):
             video_id, 
             config, 
             device='cuda',
-            worker_type='GPU'
+            worker_type='GPU',
+            inference_done_callback=release_gpu
         )
         
         return result
         
     finally:
-        # Always mark GPU as free when done
-        mark_gpu_busy(False)
-        logger.info(f"[GPU Worker] Video {video_id} finished - GPU marked as FREE")
+        # Always mark GPU as free when done (no-op if already released)
+        release_gpu()
 
 
-@celery_app.task(bind=True, base=DatabaseTask, name='app.tasks.process_video_cpu')
+@celery_app.task(
+    bind=True,
+    base=DatabaseTask,
+    name='app.tasks.process_video_cpu',
+    acks_late=True,
+    time_limit=VIDEO_TASK_TIME_LIMIT,
+    soft_time_limit=VIDEO_TASK_SOFT_TIME_LIMIT,
+)
 def process_video_cpu(self, video_id: int, config: Dict[str, Any]):
     """Process video using CPU"""
     logger.info(f"[CPU Worker] Starting video {video_id}")
@@ -88,7 +134,8 @@ def _process_video_common(
     video_id: int, 
     config: Dict[str, Any], 
     device: str, 
-    worker_type: str
+    worker_type: str,
+    inference_done_callback=None
 ) -> Dict[str, Any]:
     """Common video processing logic for both GPU and CPU workers"""
     
@@ -106,7 +153,7 @@ def _process_video_common(
     
     try:
         # Get video from database
-        video = task_self.db.query(Video).filter(Video.id == video_id).first()
+        video = task_self.db.get(Video, video_id)
         
         if not video:
             raise Exception(f"Video {video_id} not found in database")
@@ -131,13 +178,19 @@ def _process_video_common(
         )
         
         # Progress callback - updates both Redis and database
+        last_progress_publish = 0.0
+        last_db_frame = 0
+        
         def update_progress(current: int, total: int):
+            nonlocal last_progress_publish, last_db_frame
             progress = int((current / total) * 100)
             
-            # Update Celery task state (stored in Redis)
-            task_self.update_state(
-                state='PROCESSING',
-                meta={
+            # Publish a small progress snapshot at most PROGRESS_PUBLISH_INTERVAL
+            # apart instead of rewriting the Celery result meta every frame
+            now = time.monotonic()
+            if now - last_progress_publish >= PROGRESS_PUBLISH_INTERVAL or current >= total:
+                last_progress_publish = now
+                publish_progress(video_id, {
                     'video_id': video_id,
                     'progress': progress,
                     'current_frame': current,
@@ -145,11 +198,11 @@ def _process_video_common(
                     'status': f'[{worker_type}] Processing frame {current}/{total}',
                     'device': device,
                     'worker_type': worker_type
-                }
-            )
+                })
             
-            # Update database every 10 frames
-            if current % 10 == 0:
+            # Pollers read the Redis snapshot; the DB only needs a coarse checkpoint
+            if current - last_db_frame >= PROGRESS_DB_INTERVAL_FRAMES:
+                last_db_frame = current
                 video.processed_frames = current
                 task_self.db.commit()
         
@@ -167,7 +220,9 @@ def _process_video_common(
             speed_limit=config.get('speed_limit', 80.0),
             enable_plate_detection=config.get('enable_plate_detection', False),   # <-- ADD THIS
             video_id=video_id,
-            db=task_self.db
+            db=task_self.db,
+            inference_done_callback=inference_done_callback,
+            batch_size=config.get('batch_size')
         )
         # --- end replacement ---
 
@@ -183,6 +238,7 @@ def _process_video_common(
         video.processed_at = datetime.utcnow()
         video.speed_limit = config.get('speed_limit', 50.0)
         task_self.db.commit()
+        publish_task_done(video_id, "completed")
         
         logger.info(f"[{worker_type}] ✅ Video {video_id} completed successfully")
         logger.info(f"[{worker_type}] Stats: {stats.get('vehicle_count')} vehicles, "
@@ -203,13 +259,14 @@ def _process_video_common(
         
         # Update video status to failed
         try:
-            video = task_self.db.query(Video).filter(Video.id == video_id).first()
+            video = task_self.db.get(Video, video_id)
             if video:
                 video.status = "failed"
                 video.error_message = error_msg
                 task_self.db.commit()
         except Exception as db_error:
             logger.error(f"[{worker_type}] Failed to update error status: {str(db_error)}")
+        publish_task_done(video_id, "failed")
         
         # Re-raise for Celery to handle
         raise
\ No newline at end of file
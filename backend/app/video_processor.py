@@ -3,21 +3,49 @@ Video processing logic with zone-based speed estimation
 """
 import cv2
 import numpy as np
-from collections import defaultdict, deque
 from ultralytics import YOLO
 from datetime import datetime
 import supervision as sv
 from pathlib import Path
+from functools import lru_cache
 from .config import settings
-from .speed_estimator import ZonedSpeedEstimator, SimpleFallbackEstimator, FourPointSpeedEstimator
+from .speed_estimator import (
+    ZonedSpeedEstimator,
+    SimpleFallbackEstimator,
+    FourPointSpeedEstimator,
+    TrajectoryStore,
+)
 import logging
 import copy
+import queue
+import threading
 import torch
 import easyocr
 # Directory for snapshots
 SNAPSHOT_DIR = Path("processed/snapshots")
 SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
 
+# COCO class IDs kept by the detector: 2 = car, 3 = motorcycle, 5 = bus, 7 = truck
+VEHICLE_CLASS_IDS = [2, 3, 5, 7]
+
+# Annotated frames buffered ahead of the encoder thread; each is a distinct
+# array, so the encoder can hold one while the next frame is annotated
+ENCODE_QUEUE_FRAMES = 4
+
+# Trajectory histories kept at once; the least recently seen are dropped
+MAX_ACTIVE_TRACKS = 256
+
+# Rows per executemany when saving vehicle detections
+DETECTION_INSERT_BATCH = 1000
+
+# Loaded YOLO models per device, shared by every VideoProcessor in this
+# worker process so each task doesn't reload weights and re-init CUDA
+_MODEL_CACHE = {}
+
+# Largest batch each cached TensorRT engine was built for, by device; engines
+# reject batches above their optimisation profile (PyTorch models have no cap)
+_ENGINE_MAX_BATCH = {}
+
 logger = logging.getLogger("projectcars")
 
 def save_snapshot(frame, video_id, track_id, frame_number):
@@ -68,6 +96,134 @@ def run_ocr(image_path):
     return cleaned, conf
 
 
+def batched_inference(model, frames, batch_size, **predict_kwargs):
+    """
+    Run the model on batches of frames, yielding (frame, result) in order
+    One forward pass per batch amortizes launch and host-device copy overhead
+    """
+    batch = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) == batch_size:
+            yield from zip(batch, model(batch, verbose=False, **predict_kwargs))
+            batch = []
+    if batch:
+        yield from zip(batch, model(batch, verbose=False, **predict_kwargs))
+
+
+@lru_cache(maxsize=8)
+def frame_annotators(resolution_wh):
+    """
+    Line thickness plus the stateless box/label annotators for a resolution
+    Shared across videos; TraceAnnotator keeps per-track history, so it is not
+    """
+    thickness = sv.calculate_optimal_line_thickness(resolution_wh=resolution_wh)
+    text_scale = sv.calculate_optimal_text_scale(resolution_wh=resolution_wh)
+    box_annotator = sv.BoxAnnotator(thickness=thickness)
+    label_annotator = sv.LabelAnnotator(
+        text_scale=text_scale,
+        text_thickness=thickness,
+        text_position=sv.Position.BOTTOM_CENTER,
+    )
+    return thickness, box_annotator, label_annotator
+
+
+class _Failure:
+    """Exception raised on a pipeline thread, re-raised on the consumer side"""
+    
+    def __init__(self, exc):
+        self.exc = exc
+
+
+_END = object()
+
+
+def _put_unless_stopped(q, item, stop):
+    """Blocking put that gives up once the consumer has gone away"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def threaded_prefetch(iterable, maxsize, name="frame-decode"):
+    """
+    Iterate `iterable` on a background thread, buffering up to maxsize items
+    Lets frame decoding or inference (OpenCV and torch drop the GIL) overlap
+    with the consumer
+    """
+    q = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+    
+    def produce():
+        try:
+            for item in iterable:
+                if not _put_unless_stopped(q, item, stop):
+                    return
+        except BaseException as e:
+            _put_unless_stopped(q, _Failure(e), stop)
+            return
+        _put_unless_stopped(q, _END, stop)
+    
+    thread = threading.Thread(target=produce, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                raise item.exc
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+class ThreadedFrameWriter:
+    """
+    Feed a VideoSink from a background thread so encoding overlaps with inference
+    Use as a context manager; leaving it waits for every queued frame to be written
+    """
+    
+    def __init__(self, sink, maxsize):
+        self._sink = sink
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="frame-encode", daemon=True)
+    
+    def _run(self):
+        while True:
+            frame = self._queue.get()
+            if frame is _END:
+                return
+            # Keep draining after a failure so the producer never blocks on a full queue
+            if self._error is None:
+                try:
+                    self._sink.write_frame(frame)
+                except BaseException as e:
+                    self._error = e
+    
+    def write_frame(self, frame):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(frame)
+    
+    def __enter__(self):
+        self._thread.start()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self._queue.put(_END)
+        self._thread.join()
+        if exc_type is None and self._error is not None:
+            raise self._error
+        return False
+
+
 class VideoProcessor:
     """Main video processor with zone-based speed estimation"""
     
@@ -87,22 +243,72 @@ class VideoProcessor:
         self.device = device  # ← ADD THIS
         self.model = None
     
+    def _load_tensorrt_engine(self):
+        """
+        Load the FP16 TensorRT engine, exporting it next to the weights on first use
+        Built with a dynamic batch up to INFERENCE_BATCH_SIZE at the default 640 imgsz
+        """
+        engine_path = Path(settings.YOLO_MODEL).with_suffix('.engine')
+        if not engine_path.exists():
+            logger.info(f"Exporting TensorRT engine to {engine_path} (one-time, may take minutes)...")
+            exported = YOLO(settings.YOLO_MODEL).export(
+                format='engine',
+                half=True,
+                dynamic=True,
+                batch=settings.INFERENCE_BATCH_SIZE,
+                workspace=4,
+                device=0,
+            )
+            engine_path = Path(exported)
+        model = YOLO(str(engine_path), task='detect')
+        logger.info(f"✅ TensorRT FP16 engine loaded: {engine_path}")
+        return model
+    
     def load_model(self):
-        """Load YOLO model (lazy loading) and move to device"""
+        """Load YOLO model (lazy loading, cached per device) and move to device"""
         if self.model is None:
-            logger.info(f"Loading YOLO model on {self.device}...")
-            self.model = YOLO(settings.YOLO_MODEL)
-            
-            # Move model to specified device
-            if self.device == 'cuda' and torch.cuda.is_available():
-                self.model.to('cuda')
-                logger.info(f"✅ Model loaded on GPU: {torch.cuda.get_device_name(0)}")
-            else:
-                self.model.to('cpu')
-                logger.info("✅ Model loaded on CPU")
+            self.model = _MODEL_CACHE.get(self.device)
+        if self.model is None:
+            self.model = self._load_model_uncached()
+            _MODEL_CACHE[self.device] = self.model
         
         return self.model
     
+    def _load_model_uncached(self):
+        logger.info(f"Loading YOLO model on {self.device}...")
+        use_cuda = self.device == 'cuda' and torch.cuda.is_available()
+        
+        if use_cuda and settings.USE_TRT:
+            try:
+                model = self._load_tensorrt_engine()
+                _ENGINE_MAX_BATCH[self.device] = settings.INFERENCE_BATCH_SIZE
+                return model
+            except Exception as e:
+                logger.warning(f"TensorRT engine unavailable, using PyTorch weights: {e}")
+        
+        model = YOLO(settings.YOLO_MODEL)
+        
+        # Move model to specified device
+        if use_cuda:
+            model.to('cuda')
+            logger.info(f"✅ Model loaded on GPU: {torch.cuda.get_device_name(0)}")
+        else:
+            model.to('cpu')
+            logger.info("✅ Model loaded on CPU")
+        return model
+    
+    def warmup(self):
+        """Load the model and run one dummy batch to build the predictor and cuDNN plans"""
+        model = self.load_model()
+        half = self.device == 'cuda' and torch.cuda.is_available()
+        model.predict(
+            np.zeros((640, 640, 3), dtype=np.uint8),
+            half=half,
+            classes=VEHICLE_CLASS_IDS,
+            verbose=False,
+        )
+        logger.info(f"YOLO model warmed up on {self.device}")
+    
     def process_video(
         self,
         input_path: str,
@@ -115,6 +321,8 @@ class VideoProcessor:
         target_width: int = 1280,
         video_id: int = None,
         db = None,
+        inference_done_callback=None,
+        batch_size: int = None,
         ):
         """
         Process video with zone-based speed detection
@@ -127,6 +335,10 @@ class VideoProcessor:
             enable_speed_calculation: Enable speed calculation (default: True)
             speed_limit: Speed limit for flagging violations (default: 80.0)
             target_width: Max width to process (resizes 4K/2K to this width)
+            inference_done_callback: Called once the last frame has been run
+                through the model, before CPU-side finalization (snapshots, OCR,
+                DB writes) - lets GPU workers hand the GPU to the next video early
+            batch_size: Frames per YOLO forward pass (default: settings.INFERENCE_BATCH_SIZE)
         
         Returns:
             dict with processing statistics and vehicle data
@@ -202,19 +414,9 @@ class VideoProcessor:
             track_activation_threshold=self.confidence_threshold
         )
         
-        # Setup annotators
-        thickness = sv.calculate_optimal_line_thickness(
-            resolution_wh=video_info.resolution_wh
-        )
-        text_scale = sv.calculate_optimal_text_scale(
-            resolution_wh=video_info.resolution_wh
-        )
-        
-        box_annotator = sv.BoxAnnotator(thickness=thickness)
-        label_annotator = sv.LabelAnnotator(
-            text_scale=text_scale,
-            text_thickness=thickness,
-            text_position=sv.Position.BOTTOM_CENTER,
+        # Setup annotators (tracker and traces hold per-video state, so stay fresh)
+        thickness, box_annotator, label_annotator = frame_annotators(
+            tuple(video_info.resolution_wh)
         )
         trace_annotator = sv.TraceAnnotator(
             thickness=thickness,
@@ -253,11 +455,18 @@ class VideoProcessor:
         
         # Statistics
         unique_vehicles = set()
-        all_speeds = []
+        # Running speed aggregates - O(1) state however long the video is
+        speed_count = 0
+        speed_sum = 0.0
+        speed_max = float("-inf")
+        speed_min = float("inf")
         frame_count = 0
         
         # Track vehicle trajectories (for speed calculation)
-        vehicle_trajectories = defaultdict(lambda: deque(maxlen=video_info.fps))
+        vehicle_trajectories = TrajectoryStore(video_info.fps, max_tracks=MAX_ACTIVE_TRACKS)
+        
+        # "#<id>" labels, built once per track and reused every frame it is seen
+        id_labels = {}
         
         # Store max speed data for each vehicle: {track_id: {'speed': float, 'frame': int, 'timestamp': float}}
         vehicle_max_speeds = {}
@@ -266,69 +475,65 @@ class VideoProcessor:
         
         # Process video
         frame_generator = sv.get_video_frames_generator(source_path=input_path)
+        if scale_factor != 1.0:
+            # Resize before batching so the model sees the processing resolution
+            frame_generator = (
+                cv2.resize(frame, (new_width, new_height)) for frame in frame_generator
+            )
         
-        with sv.VideoSink(output_path, video_info) as sink:
-            for frame in frame_generator:
-                # Resize frame if needed
-                if scale_factor != 1.0:
-                    frame = cv2.resize(frame, (new_width, new_height))
-
+        batch_size = batch_size or settings.INFERENCE_BATCH_SIZE
+        engine_max_batch = _ENGINE_MAX_BATCH.get(self.device)
+        if engine_max_batch is not None and batch_size > engine_max_batch:
+            logger.warning(
+                f"Requested batch size {batch_size} exceeds the TensorRT engine's "
+                f"max batch {engine_max_batch} (INFERENCE_BATCH_SIZE); clamping"
+            )
+            batch_size = engine_max_batch
+        logger.info(f"Inference batch size: {batch_size}")
+        
+        # Decode, inference and encode each run on their own thread; bounded
+        # queues apply backpressure
+        decode_queue_size = 2 * batch_size
+        with sv.VideoSink(output_path, video_info) as video_sink, \
+                ThreadedFrameWriter(video_sink, maxsize=ENCODE_QUEUE_FRAMES) as sink:
+            # FP16 on CUDA (a no-op for an FP16 TensorRT engine); CPU stays FP32
+            half = self.device == 'cuda' and torch.cuda.is_available()
+            frames = threaded_prefetch(frame_generator, maxsize=decode_queue_size)
+            # Confidence, vehicle-class and NMS filtering run inside the model
+            # call (conf/iou/classes). Converting on the inference thread keeps
+            # the device->host copy there, so tracking and annotation below
+            # overlap the next batch's forward pass
+            inferred = (
+                (frame, sv.Detections.from_ultralytics(result))
+                for frame, result in batched_inference(
+                    model,
+                    frames,
+                    batch_size,
+                    half=half,
+                    conf=self.confidence_threshold,
+                    iou=self.iou_threshold,
+                    classes=VEHICLE_CLASS_IDS,
+                )
+            )
+            for frame, detections in threaded_prefetch(inferred, maxsize=batch_size, name="inference"):
                 frame_count += 1
                 current_timestamp = frame_count / video_info.fps
-                
-                # -----------------------------
-                # YOLO vehicle-only detection
-                # -----------------------------
-
-                # Allowed COCO class IDs:
-                # 2 = car, 3 = motorcycle, 5 = bus, 7 = truck
-                ALLOWED_CLASSES = {2, 3, 5, 7}
-
-                # Run YOLO
-                result = model(frame)[0]
-
-                # Convert to Supervision detections
-                detections = sv.Detections.from_ultralytics(result)
-
-                # 1️⃣ Filter by confidence
-                detections = detections[detections.confidence > self.confidence_threshold]
 
-                # 2️⃣ Filter by class — **REMOVE all non-vehicle detections**
-                if len(detections) > 0:
-                    class_ids = detections.class_id
-                    vehicle_mask = np.array([cls in ALLOWED_CLASSES for cls in class_ids])
-                    detections = detections[vehicle_mask]
-
-                # 3️⃣ Apply polygon zone filter (if calibrated)
+                # Apply polygon zone filter (if calibrated)
                 if polygon_zone is not None and len(detections) > 0:
                     try:
                         zone_mask = polygon_zone.trigger(detections)
                         detections = detections[zone_mask]
                     except Exception as e:
                         logger.warning("Polygon zone filtering failed: %s", str(e))
-
-                # 4️⃣ Apply NMS
-                detections = detections.with_nms(threshold=self.iou_threshold)
-
-
-                # If we have a calibrated polygon zone (4-point), restrict detections to that area
-                if polygon_zone is not None and len(detections) > 0:
-                    try:
-                        zone_mask = polygon_zone.trigger(detections)
-                        detections = detections[zone_mask]
-                    except Exception as e:
-                        logger.warning("Polygon zone filtering failed: %s", str(e))
-
-                # Apply NMS
-                detections = detections.with_nms(threshold=self.iou_threshold)
                 
                 # Update tracker
                 detections = byte_track.update_with_detections(detections=detections)
                 
                 # Track unique vehicles
                 if detections.tracker_id is not None:
-                    for tracker_id in detections.tracker_id:
-                        unique_vehicles.add(int(tracker_id))
+                    # tolist() converts in C; set.update avoids a Python-level loop
+                    unique_vehicles.update(detections.tracker_id.tolist())
                 
                 # Get vehicle positions (bottom center)
                 points = detections.get_anchors_coordinates(
@@ -338,31 +543,36 @@ class VideoProcessor:
                 # Update trajectories and calculate speeds
                 labels = []
                 if detections.tracker_id is not None:
-                    for tracker_id, point in zip(detections.tracker_id, points):
+                    # Convert once to native ints/floats - iterating the arrays
+                    # directly boxes a numpy scalar per element
+                    tracker_ids = detections.tracker_id.tolist()
+                    boxes = detections.xyxy.astype(int).tolist()
+                    for tracker_id, point, box in zip(tracker_ids, points.tolist(), boxes):
                         # Add point to trajectory
-                        vehicle_trajectories[tracker_id].append(tuple(point))
+                        trajectory = vehicle_trajectories.append(tracker_id, point).view()
+                        id_label = id_labels.get(tracker_id)
+                        if id_label is None:
+                            id_label = id_labels[tracker_id] = f"#{tracker_id}"
 
                         # Calculate speed if enabled and we have enough points
-                        trajectory = list(vehicle_trajectories[tracker_id])
 
                         if not enable_speed_calculation or speed_estimator is None:
                             # Speed calculation disabled - show ID only
-                            labels.append(f"#{tracker_id}")
+                            labels.append(id_label)
                             continue
                         
-                        # Get bbox for each detection
-                        bbox = detections.xyxy[detections.tracker_id == tracker_id]
-                        if len(bbox) > 0:
-                            x1, y1, x2, y2 = map(int, bbox[0])
-                            area = (x2 - x1) * (y2 - y1)
-
-                            # Store best snapshot (biggest bbox = closest = best plate visibility)
-                            if tracker_id not in best_snapshots or area > best_snapshots[tracker_id]["area"]:
-                                best_snapshots[tracker_id] = {
-                                    "area": area,
-                                    "crop": frame[y1:y2, x1:x2] if y2 > y1 and x2 > x1 else frame,
-                                    "frame_number": frame_count
-                                }
+                        # Bbox of this detection (same row as its tracker id)
+                        x1, y1, x2, y2 = box
+                        area = (x2 - x1) * (y2 - y1)
+
+                        # Store best snapshot (biggest bbox = closest = best plate visibility)
+                        if tracker_id not in best_snapshots or area > best_snapshots[tracker_id]["area"]:
+                            # Copy: the frame itself is annotated in place below
+                            best_snapshots[tracker_id] = {
+                                "area": area,
+                                "crop": (frame[y1:y2, x1:x2] if y2 > y1 and x2 > x1 else frame).copy(),
+                                "frame_number": frame_count
+                            }
                                 
                         # -----------------------------
                         # SNAPSHOT SELECTION LOGIC
@@ -378,7 +588,7 @@ class VideoProcessor:
                             x2c = max(0, min(x2, w - 1))
                             y2c = max(0, min(y2, h - 1))
 
-                            crop = frame[y1c:y2c, x1c:x2c] if (y2c > y1c and x2c > x1c) else frame
+                            crop = (frame[y1c:y2c, x1c:x2c] if (y2c > y1c and x2c > x1c) else frame).copy()
 
                             # Store best snapshot data
                             best_snapshots[tracker_id] = {
@@ -391,7 +601,7 @@ class VideoProcessor:
 
                         if len(trajectory) < video_info.fps / 4:  # Need at least 0.25 seconds of data
                             # Not enough data yet
-                            labels.append(f"#{tracker_id}")
+                            labels.append(id_label)
                         else:
                             # Calculate speed using zone-based estimation
                             speed = speed_estimator.estimate_speed(
@@ -400,7 +610,12 @@ class VideoProcessor:
                             )
 
                             if speed is not None and 0 < speed < 200:  # Sanity check
-                                all_speeds.append(speed)
+                                speed_count += 1
+                                speed_sum += speed
+                                if speed > speed_max:
+                                    speed_max = speed
+                                if speed < speed_min:
+                                    speed_min = speed
                                 
                                 # Update max speed for this vehicle
                                 if tracker_id not in vehicle_max_speeds or speed > vehicle_max_speeds[tracker_id]['speed']:
@@ -417,14 +632,14 @@ class VideoProcessor:
                                     
                                 labels.append(f"#{tracker_id} {int(speed)} km/h")
                             else:
-                                labels.append(f"#{tracker_id}")
+                                labels.append(id_label)
                 else:
                     labels = []
                 
-                # Annotate frame
-                annotated_frame = frame.copy()
+                # Annotate frame in place - nothing reads the raw frame after this
+                # point (snapshot crops are copies), so skip a full-frame copy
                 annotated_frame = trace_annotator.annotate(
-                    scene=annotated_frame, detections=detections
+                    scene=frame, detections=detections
                 )
                 annotated_frame = box_annotator.annotate(
                     scene=annotated_frame, detections=detections
@@ -439,25 +654,37 @@ class VideoProcessor:
                 # Progress callback
                 if progress_callback and frame_count % 10 == 0:  # Update every 10 frames
                     progress_callback(frame_count, video_info.total_frames)
+            
+            # All inference is issued - wait for it, then free the GPU for the next video
+            if self.device == 'cuda' and torch.cuda.is_available():
+                torch.cuda.synchronize()
+            if inference_done_callback:
+                inference_done_callback()
         
         # After the main processing loop (after the 'with sv.VideoSink...' block)
                 
         # Save vehicle detections to database if db session provided
         if db and video_id:
             try:
+                from sqlalchemy import insert
                 from .models import VehicleDetection
                 
                 logger.info(f"Saving {len(vehicle_max_speeds)} vehicle detections to database")
                 
+                # Plain parameter dicts, inserted in executemany batches below
+                detections = []
                 for track_id, detection_data in vehicle_max_speeds.items():
-                    detection = VehicleDetection(
-                        video_id=video_id,
-                        track_id=int(track_id),
-                        timestamp=detection_data['timestamp'],
-                        frame_number=detection_data['frame'],
-                        speed=detection_data['speed'],
-                        is_speeding=detection_data['speed'] > speed_limit
-                    )
+                    detection = {
+                        "video_id": video_id,
+                        "track_id": int(track_id),
+                        "timestamp": detection_data['timestamp'],
+                        "frame_number": detection_data['frame'],
+                        "speed": detection_data['speed'],
+                        "is_speeding": detection_data['speed'] > speed_limit,
+                        "snapshot_path": None,
+                        "number_plate": None,
+                        "number_plate_confidence": None,
+                    }
 
                     # -----------------------------
                     # SAVE SNAPSHOT + OCR (optional)
@@ -469,7 +696,7 @@ class VideoProcessor:
 
                         # Save snapshot to file
                         snapshot_path = save_snapshot(crop, video_id, track_id, fnum)
-                        detection.snapshot_path = snapshot_path
+                        detection["snapshot_path"] = snapshot_path
 
                         # Run OCR only if enabled
                         if enable_plate_detection:
@@ -479,15 +706,18 @@ class VideoProcessor:
                                 plate, conf = run_ocr(snapshot_path)
                                 logger.info(f"[OCR] RESULT track_id={track_id} → plate={plate}, conf={conf}")
 
-                                detection.number_plate = plate
-                                detection.number_plate_confidence = conf
+                                detection["number_plate"] = plate
+                                detection["number_plate_confidence"] = conf
 
                             except Exception as e:
                                 logger.error(f"[OCR] ERROR track_id={track_id}: {e}", exc_info=True)
 
 
-                    db.add(detection)
+                    detections.append(detection)
 
+                # One compiled INSERT per batch instead of an ORM object per row
+                for start in range(0, len(detections), DETECTION_INSERT_BATCH):
+                    db.execute(insert(VehicleDetection), detections[start:start + DETECTION_INSERT_BATCH])
                 db.commit()
 
                 logger.info(f"Vehicle detections saved successfully for video ID {video_id}")
@@ -496,15 +726,16 @@ class VideoProcessor:
                 logger.error(f"Failed to save vehicle detections: {str(e)}", exc_info=True)
                 # Don't fail the entire processing if detection saving fails
         # Calculate statistics
+        has_speeds = enable_speed_calculation and speed_count > 0
         stats = {
                 "vehicle_count": len(unique_vehicles),
-                "avg_speed": float(np.mean(all_speeds)) if enable_speed_calculation and all_speeds else None,  # Convert to float
-                "max_speed": float(np.max(all_speeds)) if enable_speed_calculation and all_speeds else None,    # Convert to float
-                "min_speed": float(np.min(all_speeds)) if enable_speed_calculation and all_speeds else None,    # Convert to float
+                "avg_speed": float(speed_sum / speed_count) if has_speeds else None,  # Convert to float
+                "max_speed": float(speed_max) if has_speeds else None,    # Convert to float
+                "min_speed": float(speed_min) if has_speeds else None,    # Convert to float
                 "total_frames": int(video_info.total_frames),  # Convert to int
                 "fps": float(video_info.fps),  # Convert to float
                 "duration": float(video_info.total_frames / video_info.fps),  # Convert to float
-                "speeds_calculated": len(all_speeds) if enable_speed_calculation else 0,
+                "speeds_calculated": speed_count if enable_speed_calculation else 0,
                 "vehicle_detections": {int(k): {'speed': float(v['speed']), 'frame': int(v['frame']), 'timestamp': float(v['timestamp'])} for k, v in vehicle_max_speeds.items()}  # Convert nested dict
 
         }
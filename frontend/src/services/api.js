@@ -122,6 +122,32 @@ export const videoAPI = {
     return response.data;
   },
 
+  /**
+   * Get processing status for several videos in one request
+   * @param {number[]} ids - Video IDs
+   * @returns {Promise} Array of processing statuses
+   */
+  getStatuses: async (ids) => {
+    const response = await api.get('/videos/status', {
+      params: { ids: ids.join(',') },
+    });
+    return response.data;
+  },
+
+  /**
+   * Wait (long-poll) until processing finishes, then get the status
+   * @param {number} id - Video ID
+   * @param {number} timeout - Max seconds to wait server-side
+   * @returns {Promise} Processing status
+   */
+  waitForCompletion: async (id, timeout = 60) => {
+    const response = await api.get(`/videos/${id}/wait`, {
+      params: { timeout },
+      timeout: (timeout + 10) * 1000,
+    });
+    return response.data;
+  },
+
   /**
    * Get download URL for processed video
    * @param {number} id - Video ID